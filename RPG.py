@@ -6,6 +6,7 @@ from pygame.locals import *
 from collections import defaultdict
 import copy
 from perlin_noise import PerlinNoise  # 需要安装 perlin-noise 库
+from tile_atlas import TileAtlas
 
 # 颜色定义
 COLORS = {
@@ -128,6 +129,35 @@ TERRAIN_PASSABLE = {
     Terrain.PATH: True,
 }
 
+# 地形颜色
+TERRAIN_COLORS = {
+    Terrain.GRASS: COLORS["grass"],
+    Terrain.MUD: COLORS["mud"],
+    Terrain.SMALL_TREE: COLORS["small_tree"],
+    Terrain.DARK_GRASS: COLORS["dark_grass"],
+    Terrain.BIG_TREE: COLORS["big_tree"],
+    Terrain.THORNS: COLORS["thorns"],
+    Terrain.ROCK: COLORS["rock"],
+    Terrain.SANDSTONE: COLORS["sandstone"],
+    Terrain.SAND: COLORS["sand"],
+    Terrain.BASALT: COLORS["basalt"],
+    Terrain.LAVA: COLORS["lava"],
+    Terrain.WATER: COLORS["water"],
+    Terrain.SHALLOW_WATER: COLORS["shallow_water"],
+    Terrain.CLIFF: COLORS["cliff"],
+    Terrain.MEADOW: COLORS["meadow"],
+    Terrain.SWAMP: COLORS["swamp"],
+    Terrain.HOUSE_GRASS: COLORS["house_grass"],
+    Terrain.HOUSE_FOREST: COLORS["house_forest"],
+    Terrain.HOUSE_DESERT: COLORS["house_desert"],
+    Terrain.HOUSE_VOLCANO: COLORS["house_volcano"],
+    Terrain.VILLAGE_CENTER: COLORS["village_center"],
+    Terrain.PATH: COLORS["path"],
+}
+
+# 地形图块（纯色，无装饰）
+TERRAIN_ATLAS = TileAtlas(TILE_SIZE, TERRAIN_COLORS)
+
 
 # 在所有生态系统地形权重
 ECOSYSTEM_TERRAIN_WEIGHTS = {
@@ -963,57 +993,9 @@ class GameMap:
         for y in range(start_y, end_y + 1):
             for x in range(start_x, end_x + 1):
                 terrain = self.get_terrain(x, y)
-                color = COLORS["grass"]  # 默认颜色
-
-                # Map terrain type to color
-                if terrain == Terrain.GRASS:
-                    color = COLORS["grass"]
-                elif terrain == Terrain.MUD:
-                    color = COLORS["mud"]
-                elif terrain == Terrain.SMALL_TREE:
-                    color = COLORS["small_tree"]
-                elif terrain == Terrain.DARK_GRASS:
-                    color = COLORS["dark_grass"]
-                elif terrain == Terrain.BIG_TREE:
-                    color = COLORS["big_tree"]
-                elif terrain == Terrain.THORNS:
-                    color = COLORS["thorns"]
-                elif terrain == Terrain.ROCK:
-                    color = COLORS["rock"]
-                elif terrain == Terrain.SANDSTONE:
-                    color = COLORS["sandstone"]
-                elif terrain == Terrain.SAND:
-                    color = COLORS["sand"]
-                elif terrain == Terrain.BASALT:
-                    color = COLORS["basalt"]
-                elif terrain == Terrain.LAVA:
-                    color = COLORS["lava"]
-                elif terrain == Terrain.WATER:
-                    color = COLORS["water"]
-                elif terrain == Terrain.SHALLOW_WATER:
-                    color = COLORS["shallow_water"]
-                elif terrain == Terrain.CLIFF:
-                    color = COLORS["cliff"]
-                elif terrain == Terrain.MEADOW:
-                    color = COLORS["meadow"]
-                elif terrain == Terrain.SWAMP:
-                    color = COLORS["swamp"]
-                elif terrain == Terrain.HOUSE_GRASS:
-                    color = COLORS["house_grass"]
-                elif terrain == Terrain.HOUSE_FOREST:
-                    color = COLORS["house_forest"]
-                elif terrain == Terrain.HOUSE_DESERT:
-                    color = COLORS["house_desert"]
-                elif terrain == Terrain.HOUSE_VOLCANO:
-                    color = COLORS["house_volcano"]
-                elif terrain == Terrain.VILLAGE_CENTER:
-                    color = COLORS["village_center"]
-                elif terrain == Terrain.PATH:
-                    color = COLORS["path"]
-
                 rect = pygame.Rect(x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE)
                 screen_rect = camera.apply_rect(rect)
-                pygame.draw.rect(surface, color, screen_rect)
+                TERRAIN_ATLAS.draw(surface, terrain.value, screen_rect.x, screen_rect.y)
 
 # 技能系统 --------------------------------------------------
 class Skill:
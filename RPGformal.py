@@ -2,10 +2,23 @@ import pygame
 import random
 import math
 import copy
+import os
+import mmap
+import shutil
+import struct
+import heapq
+import tempfile
+import time
+import argparse
+from bisect import bisect
 from enum import Enum
 from pygame.locals import *
-from collections import defaultdict
+import numpy as np  # pip install numpy
+from itertools import accumulate
+from collections import defaultdict, deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from perlin_noise import PerlinNoise  # pip install perlin-noise
+from tile_atlas import TileAtlas
 
 # Initialize Pygame
 pygame.init()
@@ -16,6 +29,49 @@ TILE_SIZE = 32
 PLAYER_SPEED = 4
 CHUNK_SIZE = 16  # Each chunk contains 16x16 tiles
 
+# Batched noise must match the scalar PerlinNoise output to within this
+# absolute difference (differences are floating point rounding only)
+NOISE_TOLERANCE = 1e-9
+NOISE_CACHE_RADIUS = 2  # Keep noise samples for chunks this close to the player
+CHUNK_WORKERS = 2  # Background threads building whole chunks (noise and terrain)
+CHUNK_PREFETCH_FRAMES = 90  # Prefetch chunks where the player will be this many frames ahead
+CHUNK_KEEP_RADIUS = 3  # Chunks this close to the player are never evicted
+MAX_RESIDENT_CHUNKS = 64  # Chunks kept in memory before the least recently used are dropped (to disk if persisted)
+REGION_SIZE = 32  # Chunk store region files hold REGION_SIZE x REGION_SIZE chunks
+PERSIST_EVICTED_CHUNKS = False  # Store evicted chunks on disk instead of regenerating them from the seed
+GRADIENT_CACHE_SIZE = 4096  # Lattice gradients kept per noise field
+CHUNK_SURFACE_CACHE_SIZE = 16  # Pre-rendered chunk surfaces kept for drawing
+SPATIAL_CELL_SIZE = TILE_SIZE * 4  # Cell size of the entity spatial grid, in pixels
+ENTITY_KEEP_RADIUS = 2  # Entities of chunks farther than this from the player are despawned to records
+MAX_ENTITY_RECORD_CHUNKS = 256  # Chunks whose despawned entities are remembered; older ones are repopulated afresh
+ITEM_PICKUP_RADIUS = TILE_SIZE * 0.8
+NPC_INTERACTION_RADIUS = TILE_SIZE * 2
+
+# Monster simulation level of detail
+SIM_FULL_MARGIN = TILE_SIZE * 4  # Monsters this close to the camera view get full updates
+SIM_COARSE_RADIUS = CHUNK_SIZE * TILE_SIZE * 2  # Beyond the view, monsters within this distance get coarse AI ticks
+SIM_COARSE_INTERVAL = 6  # Frames between coarse AI ticks
+FAST_FORWARD_STEP = 1 / 60  # Catch up status effects on wake one 60 FPS frame at a time
+HEADLESS_TIMESTEP = 1 / 60  # Fixed simulated seconds per frame in headless mode
+DRAW_MARGIN = TILE_SIZE * 2  # Floating texts reach this far beyond the sprite of their entity
+FLOW_FIELD_RADIUS = 1  # The flow field to the player covers chunks this close to the player's chunk
+PATHFINDING_BUDGET_MS = 2.0  # Milliseconds per frame spent on queued A* searches
+PATHFINDING_SEARCHES_PER_FRAME = 8  # A* searches per frame in fixed-timestep runs, instead of the time budget
+PATH_CACHE_SIZE = 512  # Paths kept by (start tile, goal tile)
+PATH_SEARCH_MARGIN = 8  # A* searches the box around start and goal grown by this many tiles
+BATCH_MONSTER_MOVEMENT = False  # Step the movement of all updated monsters at once with NumPy
+
+# Sprite frame caches
+SPRITE_ANIMATION_FRAMES = 32  # Animation poses rendered per 2*pi cycle of animation_frame
+MONSTER_FRAME_CACHE_SIZE = 1024  # Rendered monster frames shared by all monsters
+PLAYER_FRAME_CACHE_SIZE = 512  # Rendered player frames kept for the equipped weapon
+NPC_FRAME_CACHE_SIZE = 512  # Rendered NPC frames shared by all NPCs
+ITEM_FRAME_CACHE_SIZE = 256  # Rendered dropped item frames shared by all items
+GLOW_FRAMES = 8  # Frames in the pulsing glow cycle of dropped items
+TEXT_CACHE_SIZE = 512  # Rendered text surfaces kept for floating texts and labels
+TEXT_LAYOUT_CACHE_SIZE = 256  # Wrapped text layouts kept for UI texts
+WORD_WIDTH_CACHE_SIZE = 8192  # Measured word widths kept across all fonts
+
 # Color Definitions
 COLORS = {
     # Terrain colors
@@ -36,6 +92,7 @@ COLORS = {
     "house": (160, 120, 90),
     "roof": (130, 60, 40),
     "village_center": (180, 140, 100),
+    "placeholder": (30, 30, 40),  # Chunk still generating
 
     # UI colors
     "ui_background": (40, 40, 60, 220),
@@ -155,6 +212,9 @@ class PotionType(Enum):
     DEFENSE = 5
 
 
+# Enum lookup by value (used by array-based code that stores enum values)
+BIOME_BY_CODE = {biome.value: biome for biome in Biome}
+
 # Terrain Passability
 TERRAIN_PASSABLE = {
     TerrainType.GRASS: True,
@@ -176,6 +236,75 @@ TERRAIN_PASSABLE = {
     TerrainType.VILLAGE_CENTER: True
 }
 
+# Tiles whose decorations reach into the tile above
+OVERHANGING_TERRAIN = {TerrainType.FOREST, TerrainType.HOUSE}
+
+# Terrain code tables for array-backed chunks (codes are TerrainType values)
+TERRAIN_BY_CODE = [None] * (max(terrain.value for terrain in TerrainType) + 1)
+for _terrain in TerrainType:
+    TERRAIN_BY_CODE[_terrain.value] = _terrain
+TERRAIN_PASSABLE_CODES = np.array([TERRAIN_PASSABLE.get(terrain, True) for terrain in TERRAIN_BY_CODE], dtype=bool)
+
+# Terrain colors
+TERRAIN_COLORS = {
+    TerrainType.GRASS: COLORS["grass"],
+    TerrainType.TALL_GRASS: COLORS["tall_grass"],
+    TerrainType.FOREST: COLORS["forest"],
+    TerrainType.DEEP_FOREST: COLORS["deep_forest"],
+    TerrainType.WATER: COLORS["water"],
+    TerrainType.DEEP_WATER: COLORS["deep_water"],
+    TerrainType.SAND: COLORS["sand"],
+    TerrainType.MOUNTAIN: COLORS["mountain"],
+    TerrainType.SNOW: COLORS["snow"],
+    TerrainType.DESERT: COLORS["desert"],
+    TerrainType.STONE: COLORS["stone"],
+    TerrainType.LAVA: COLORS["lava"],
+    TerrainType.ROAD: COLORS["road"],
+    TerrainType.PATH: COLORS["path"],
+    TerrainType.HOUSE: COLORS["house"],
+    TerrainType.ROOF: COLORS["roof"],
+    TerrainType.VILLAGE_CENTER: COLORS["village_center"]
+}
+
+
+def paint_terrain_tile(surface, terrain, x, y):
+    """Draw one terrain tile with its decorations, top-left corner at (x, y)"""
+    rect = pygame.Rect(x, y, TILE_SIZE, TILE_SIZE)
+    pygame.draw.rect(surface, TERRAIN_COLORS[terrain], rect)
+
+    # Add details for some terrain types
+    if terrain == TerrainType.FOREST:
+        # Draw simple tree trunk
+        trunk_rect = pygame.Rect(x + TILE_SIZE // 3, y + TILE_SIZE // 2, TILE_SIZE // 3, TILE_SIZE // 2)
+        pygame.draw.rect(surface, (100, 70, 40), trunk_rect)
+
+        # Draw simple tree top (circle)
+        pygame.draw.circle(surface, (45, 120, 45), (x + TILE_SIZE // 2, y + TILE_SIZE // 3), TILE_SIZE // 2)
+
+    elif terrain == TerrainType.HOUSE:
+        # Draw house roof
+        roof_points = [
+            (x, y),
+            (x + TILE_SIZE, y),
+            (x + TILE_SIZE // 2, y - TILE_SIZE // 2)
+        ]
+        pygame.draw.polygon(surface, COLORS["roof"], roof_points)
+
+        # Draw door
+        door_rect = pygame.Rect(x + TILE_SIZE // 3, y + TILE_SIZE // 2, TILE_SIZE // 3, TILE_SIZE // 2)
+        pygame.draw.rect(surface, (60, 30, 15), door_rect)
+
+    elif terrain == TerrainType.VILLAGE_CENTER:
+        # Draw well or fountain
+        pygame.draw.circle(surface, COLORS["stone"], (x + TILE_SIZE // 2, y + TILE_SIZE // 2), TILE_SIZE // 2)
+        pygame.draw.circle(surface, COLORS["water"], (x + TILE_SIZE // 2, y + TILE_SIZE // 2), TILE_SIZE // 3)
+
+
+# Every terrain tile rendered once; roofs and tree tops reach TILE_SIZE // 2 above their tile
+TERRAIN_ATLAS = TileAtlas(TILE_SIZE, TERRAIN_COLORS, paint_terrain_tile,
+                          decorated={TerrainType.FOREST, TerrainType.HOUSE, TerrainType.VILLAGE_CENTER},
+                          overhang=TILE_SIZE // 2)
+
 # Biome Terrain Weights
 BIOME_TERRAIN_WEIGHTS = {
     Biome.PLAINS: [
@@ -268,6 +397,35 @@ BIOME_MONSTER_WEIGHTS = {
     ]
 }
 
+# Weighted sampling
+class WeightedSampler:
+    """Cumulative weights for a fixed (item, weight) table, built once.
+
+    choose() consumes the random stream exactly like random.choices(k=1) with
+    the same weights; choose_values() maps a batch of [0, 1) rolls to item
+    values in one call.
+    """
+
+    def __init__(self, weighted_items):
+        self.items = [item for item, _ in weighted_items]
+        self.cum_weights = list(accumulate(weight for _, weight in weighted_items))
+        self.total = self.cum_weights[-1]
+        self.cum_array = np.array(self.cum_weights, dtype=np.float64)
+        self.values = np.array([item.value for item in self.items])
+
+    def choose(self, rng=random):
+        """Pick one item"""
+        return self.items[bisect(self.cum_weights, rng.random() * self.total, 0, len(self.items) - 1)]
+
+    def choose_values(self, rolls):
+        """Pick one item per roll in [0, 1), returns an array of item values"""
+        indices = np.searchsorted(self.cum_array, np.asarray(rolls) * self.total, side="right")
+        return self.values[np.minimum(indices, len(self.items) - 1)]
+
+
+TERRAIN_SAMPLERS = {biome: WeightedSampler(weights) for biome, weights in BIOME_TERRAIN_WEIGHTS.items()}
+MONSTER_SAMPLERS = {biome: WeightedSampler(weights) for biome, weights in BIOME_MONSTER_WEIGHTS.items()}
+
 # Biome Shop Configuration
 BIOME_SHOPS = {
     Biome.PLAINS: {
@@ -614,6 +772,181 @@ WEAPON_SKILLS = {
 }
 
 
+# Monster Archetypes
+class MonsterArchetype:
+    """Everything a monster type contributes to its instances, as data.
+
+    Each stat is (base, per_level) or (base, per_level, every), valued at
+    base + (level // every) * per_level, so every=1 scales with each level and
+    larger steps scale in stairs. Skills are (min_level, skill_type) pairs.
+    Stat blocks are built once per level and copied into each new monster.
+
+    A hit_effect (status, chance, duration, stat, divisor) gives each landed
+    attack that chance to inflict the status, with value max(1, stat // divisor)
+    of the attacker. Gold drops are multiplied by gold_multiplier and item drops
+    roll rarity_bonus higher.
+    """
+
+    def __init__(self, name, stats=None, speed=1.0, skills=(), attack_cooldown=1.0, hit_effect=None,
+                 gold_multiplier=1, rarity_bonus=0.0):
+        self.name = name
+        self.stat_scaling = dict(MONSTER_BASE_STATS)
+        self.stat_scaling.update(stats or {})
+        self.speed = speed
+        self.skills = [(min_level, SKILLS[skill_type]) for min_level, skill_type in skills]
+        self.attack_cooldown = attack_cooldown  # Seconds between attacks
+        self.hit_effect = hit_effect
+        self.gold_multiplier = gold_multiplier
+        self.rarity_bonus = rarity_bonus
+        self.level_stats = {}  # Level -> stat block
+
+    def get_stats(self, level):
+        """Get a fresh copy of the stats of a monster at a level"""
+        stats = self.level_stats.get(level)
+        if stats is None:
+            stats = {"level": level}
+            for stat, scaling in self.stat_scaling.items():
+                base, per_level = scaling[0], scaling[1]
+                every = scaling[2] if len(scaling) > 2 else 1
+                stats[stat] = base + (level // every) * per_level
+            stats["max_hp"] = stats["hp"]
+            stats["max_mp"] = stats["mp"]
+            self.level_stats[level] = stats
+        return stats.copy()
+
+    def get_skills(self, level):
+        """Get the skills a monster knows at a level, one copy of each per monster"""
+        return [copy.copy(skill) for min_level, skill in self.skills if level >= min_level]
+
+
+# Stats of a monster type that does not set its own
+MONSTER_BASE_STATS = {
+    "hp": (20, 5),
+    "mp": (10, 2),
+    "attack": (5, 1),
+    "defense": (2, 1, 2),
+    "crit": (3, 0),
+    "agility": (3, 0),
+    "exp_value": (10, 5),
+    "attack_range": (1, 0),
+    "attack_speed": (1.0, 0)
+}
+
+MONSTER_ARCHETYPES = {
+    MonsterType.SLIME: MonsterArchetype(
+        name="Slime",
+        stats={
+            "hp": (15, 4),
+            "attack": (3, 1),
+            "defense": (1, 1, 3),
+            "exp_value": (5, 3)
+        }
+    ),
+    MonsterType.WOLF: MonsterArchetype(
+        name="Wolf",
+        stats={
+            "hp": (18, 4),
+            "attack": (6, 1.2),
+            "agility": (7, 1, 2),
+            "crit": (5, 0),
+            "attack_speed": (1.2, 0)
+        },
+        speed=1.5,
+        skills=[(3, SkillType.CHARGE)],
+        attack_cooldown=0.8,
+        hit_effect=("bleed", 0.2, 3, "attack", 10)
+    ),
+    MonsterType.GOBLIN: MonsterArchetype(
+        name="Goblin",
+        stats={
+            "hp": (15, 3),
+            "attack": (4, 1),
+            "defense": (2, 1, 3),
+            "agility": (5, 1, 2),
+            "attack_speed": (1.1, 0)
+        },
+        speed=1.2,
+        skills=[(3, SkillType.POISON_STRIKE)]
+    ),
+    MonsterType.SKELETON: MonsterArchetype(
+        name="Skeleton",
+        stats={
+            "hp": (25, 4),
+            "mp": (5, 1),
+            "attack": (5, 1),
+            "defense": (3, 1, 2),
+            "agility": (2, 1, 3)
+        },
+        skills=[(2, SkillType.SLASH)]
+    ),
+    MonsterType.TROLL: MonsterArchetype(
+        name="Troll",
+        stats={
+            "hp": (40, 8),
+            "mp": (5, 1),
+            "attack": (8, 1.5),
+            "defense": (5, 1),
+            "agility": (1, 1, 4),
+            "attack_speed": (0.7, 0),
+            "exp_value": (15, 8)
+        },
+        speed=0.7,
+        skills=[(2, SkillType.SLASH), (5, SkillType.WHIRLWIND)],
+        attack_cooldown=1.5,
+        gold_multiplier=3
+    ),
+    MonsterType.GHOST: MonsterArchetype(
+        name="Ghost",
+        stats={
+            "hp": (20, 3),
+            "mp": (20, 3),
+            "attack": (3, 0.8),
+            "defense": (1, 1, 3),
+            "agility": (4, 1, 2),
+            "attack_range": (2, 0)
+        },
+        speed=1.3,
+        skills=[(2, SkillType.FROST_NOVA)],
+        hit_effect=("fear", 0.15, 4, "level", 1)
+    ),
+    MonsterType.DRAGON: MonsterArchetype(
+        name="Dragon",
+        stats={
+            "hp": (60, 10),
+            "mp": (30, 5),
+            "attack": (12, 2),
+            "defense": (8, 1),
+            "crit": (7, 0),
+            "agility": (3, 1, 3),
+            "attack_range": (3, 0),
+            "exp_value": (50, 15)
+        },
+        skills=[(1, SkillType.FIREBALL), (5, SkillType.WHIRLWIND)],
+        attack_cooldown=1.2,
+        hit_effect=("burn", 0.3, 3, "attack", 5),
+        gold_multiplier=5,
+        rarity_bonus=0.2
+    ),
+    MonsterType.BANDIT: MonsterArchetype(
+        name="Bandit",
+        stats={
+            "hp": (22, 4),
+            "mp": (10, 2),
+            "attack": (5, 1.1),
+            "defense": (3, 1, 2),
+            "crit": (6, 0),
+            "agility": (6, 1, 2)
+        },
+        skills=[(3, SkillType.SLASH)],
+        gold_multiplier=2,
+        rarity_bonus=0.1
+    )
+}
+
+# Archetype of a monster type missing from the table
+UNKNOWN_MONSTER = MonsterArchetype(name="Unknown Monster")
+
+
 # Equipment class
 class Equipment:
     def __init__(self, name, item_type, stats, weapon_type=None, armor_type=None, value=0, description=""):
@@ -692,6 +1025,29 @@ class Equipment:
 
         return text
 
+    def to_record(self):
+        """Plain-data copy of this item (enum values and a stats tuple), for storing it off-world"""
+        return (self.name, self.type.value,
+                self.weapon_type.value if self.weapon_type else None,
+                self.armor_type.value if self.armor_type else None,
+                tuple(self.stats.items()), self.value, self.description, self.count,
+                self.skill.type.value if self.skill else None)
+
+    @classmethod
+    def from_record(cls, record):
+        """Rebuild an item from to_record() data"""
+        name, item_type, weapon_type, armor_type, stats, value, description, count, skill_type = record
+        equipment = cls(name, ItemType(item_type), dict(stats),
+                        WeaponType(weapon_type) if weapon_type is not None else None,
+                        ArmorType(armor_type) if armor_type is not None else None,
+                        value, description)
+        equipment.count = count
+        if skill_type is None:
+            equipment.skill = None
+        elif not equipment.skill or equipment.skill.type.value != skill_type:
+            equipment.skill = copy.deepcopy(SKILLS[SkillType(skill_type)])
+        return equipment
+
 
 # Define weapons
 WEAPONS = {
@@ -903,6 +1259,235 @@ def create_upgraded_equipment():
 UPGRADED_WEAPONS, UPGRADED_ARMORS = create_upgraded_equipment()
 
 
+# Rendered sprite frames
+class SurfaceCache:
+    """Least recently used cache of rendered surfaces, keyed by everything the drawing depends on"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, render):
+        """Get the surface for a key, calling render() to draw it on a miss"""
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = render()
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        """Drop all rendered surfaces"""
+        self.surfaces.clear()
+
+
+def quantize_animation(animation_frame):
+    """Snap an animation_frame to one of SPRITE_ANIMATION_FRAMES poses per 2*pi cycle
+
+    All sprite animations are sines of integer multiples of animation_frame, so they
+    repeat every 2*pi. Returns the pose index.
+    """
+    return int(animation_frame % (2 * math.pi) / (2 * math.pi) * SPRITE_ANIMATION_FRAMES) % SPRITE_ANIMATION_FRAMES
+
+
+def pose_animation_frame(pose):
+    """Get the animation_frame a pose index is drawn at"""
+    return pose * 2 * math.pi / SPRITE_ANIMATION_FRAMES
+
+
+MONSTER_FRAMES = SurfaceCache(MONSTER_FRAME_CACHE_SIZE)
+NPC_FRAMES = SurfaceCache(NPC_FRAME_CACHE_SIZE)
+ITEM_FRAMES = SurfaceCache(ITEM_FRAME_CACHE_SIZE)
+
+# Fonts by (size, cjk), created on first use
+FONTS = {}
+
+# System fonts tried, in order, for text with Chinese, Japanese or Korean characters
+CJK_FONT_NAMES = ("notosanscjksc,notosanscjk,notosanssc,sourcehansanssc,wenquanyimicrohei,wenquanyizenhei,"
+                  "microsoftyahei,simhei,pingfangsc,hiraginosansgb,arialunicodems")
+CJK_FONT_PATH = []  # Path of the CJK font once looked up (None if there is none)
+
+
+def get_font(size, cjk=False):
+    """Get the default font at a size, or the system CJK font for text that needs one
+
+    The default font has no CJK glyphs. Without a CJK font installed the default
+    font is used for CJK text too, which still wraps correctly but shows boxes.
+    """
+    font = FONTS.get((size, cjk))
+    if font is None:
+        path = None
+        if cjk:
+            if not CJK_FONT_PATH:
+                CJK_FONT_PATH.append(pygame.font.match_font(CJK_FONT_NAMES))
+            path = CJK_FONT_PATH[0]
+        font = FONTS[(size, cjk)] = pygame.font.Font(path, size)
+    return font
+
+
+def get_text_font(text, size):
+    """Get the font a text is drawn with at a size"""
+    return get_font(size, has_cjk(text))
+
+
+TEXT_SURFACES = SurfaceCache(TEXT_CACHE_SIZE)
+
+
+def render_text(text, color, size):
+    """Get the rendered surface of a text, drawn once per text, color and size
+
+    The surface is shared, so callers blit it (with their own offset or alpha) and
+    never draw on it.
+    """
+    return TEXT_SURFACES.get((text, tuple(color), size),
+                             lambda: get_text_font(text, size).render(text, True, color))
+
+
+# Text layout
+WORD_WIDTHS = {}  # (font size, cjk font, word) -> rendered width
+TEXT_LAYOUTS = OrderedDict()  # (text, width, font size) -> wrapped lines
+
+# Punctuation that may not start a line, and that may not end one
+NO_LINE_START = set("，。、；：？！）》」』】〉”’…,.;:?!)")
+NO_LINE_END = set("（《「『【〈“‘(")
+
+
+def is_cjk(char):
+    """Check if a character is Chinese, Japanese or Korean, which break lines between any two characters"""
+    return ("\u2e80" <= char <= "\u9fff" or "\uac00" <= char <= "\ud7af"
+            or "\uf900" <= char <= "\ufaff" or "\uff00" <= char <= "\uffef")
+
+
+def has_cjk(text):
+    """Check if a text has any Chinese, Japanese or Korean characters"""
+    return any(is_cjk(char) for char in text)
+
+
+def split_line_pieces(paragraph):
+    """Split a paragraph into the pieces a line may break between
+
+    Words separated by spaces are pieces with their trailing space, as before. Inside
+    a word every CJK character is its own piece, and punctuation is kept with the
+    character it may not be separated from.
+    """
+    pieces = []
+
+    for word in paragraph.split(' '):
+        start = len(pieces)
+        run = ""
+
+        for char in word:
+            if is_cjk(char):
+                if run:
+                    pieces.append(run)
+                    run = ""
+                pieces.append(char)
+            else:
+                run += char
+
+        if run or len(pieces) == start:
+            pieces.append(run)
+        pieces[-1] += " "
+
+    merged = []
+    for piece in pieces:
+        if merged and not merged[-1].endswith(" ") and (piece[0] in NO_LINE_START or merged[-1][-1] in NO_LINE_END):
+            merged[-1] += piece
+        else:
+            merged.append(piece)
+
+    return merged
+
+
+def get_word_width(font_size, word, cjk=False):
+    """Get the rendered width of a word, measured once per font"""
+    key = (font_size, cjk, word)
+    width = WORD_WIDTHS.get(key)
+    if width is None:
+        if len(WORD_WIDTHS) >= WORD_WIDTH_CACHE_SIZE:
+            WORD_WIDTHS.clear()
+        width = WORD_WIDTHS[key] = get_font(font_size, cjk).size(word)[0]
+    return width
+
+
+def layout_text(text, font_size, width):
+    """Wrap a text into lines narrower than width, cached per text, width and font size
+
+    Line widths are the sums of the cached piece widths, so wrapping is linear in the
+    text length. Glyph advances are rounded, which puts a sum up to about a pixel per
+    piece off the width of the whole line, so a line whose sum comes that close to the
+    edge is measured whole. Lines are wrapped with the font get_text_font picks for
+    the text. Returns a tuple of lines; paragraphs are followed by an empty line when
+    there are several.
+    """
+    key = (text, width, font_size)
+    lines = TEXT_LAYOUTS.get(key)
+    if lines is not None:
+        TEXT_LAYOUTS.move_to_end(key)
+        return lines
+
+    cjk = has_cjk(text)
+    font = get_font(font_size, cjk)
+    lines = []
+    paragraphs = text.split('\n')
+
+    for paragraph in paragraphs:
+        current_line = ""
+        current_width = 0
+        summed_pieces = 0  # Pieces added to current_width since it was last measured whole
+
+        for piece in split_line_pieces(paragraph):
+            piece_width = get_word_width(font_size, piece, cjk)
+            line_width = current_width + piece_width
+            summed_pieces += 1
+
+            # Close enough to the edge for the rounding to matter, measure the line whole
+            if abs(line_width - width) <= summed_pieces + 1:
+                line_width = font.size(current_line + piece)[0]
+                summed_pieces = 0
+
+            # A piece wider than the whole line still goes on a line of its own
+            if line_width < width or not current_line:
+                current_line += piece
+                current_width = line_width
+            else:
+                lines.append(current_line)
+                current_line = piece
+                current_width = piece_width
+                summed_pieces = 1
+
+        # Add the last line
+        if current_line:
+            lines.append(current_line)
+
+        # Add empty line between paragraphs
+        if len(paragraphs) > 1:
+            lines.append("")
+
+    lines = tuple(lines)
+    TEXT_LAYOUTS[key] = lines
+    if len(TEXT_LAYOUTS) > TEXT_LAYOUT_CACHE_SIZE:
+        TEXT_LAYOUTS.popitem(last=False)
+    return lines
+
+
+# Glow color and outline width of dropped items, by rarity tier
+RARITY_GLOW = [
+    ((255, 255, 100), 1),  # Common - yellow
+    ((30, 255, 30), 1),  # Uncommon - green
+    ((30, 100, 255), 2),  # Rare - blue
+    ((255, 50, 255), 2),  # Epic - purple
+]
+
+
 # Camera class
 class Camera:
     def __init__(self, width, height):
@@ -933,12 +1518,650 @@ class Camera:
         # We'll implement this later when we have the map generation
 
 
+# Batched noise engine
+class PerlinField:
+    """Evaluate a 2D PerlinNoise generator over a whole grid with NumPy.
+
+    Mirrors perlin_noise.PerlinNoise exactly: the same lattice hashing, the same
+    seeded gradient vectors and the same fade curve. Values agree with the
+    scalar generator to within NOISE_TOLERANCE.
+    """
+
+    def __init__(self, noise):
+        self.octaves = noise.octaves
+        self.seed = noise.seed  # PerlinNoise replaces a zero seed, so read it back
+        self.gradients = {}  # (ix, iy) -> gradient vector
+
+    def get_gradient(self, ix, iy):
+        """Get the gradient vector of a lattice point"""
+        key = (ix, iy)
+        vec = self.gradients.get(key)
+        if vec is None:
+            # Same seed as perlin_noise.tools.hasher, drawn from a private
+            # generator so the global random state is never touched
+            rng = random.Random(self.seed * max(1, abs(ix + 10 * iy + 1)))
+            vec = (rng.uniform(-1, 1), rng.uniform(-1, 1))
+            if len(self.gradients) >= GRADIENT_CACHE_SIZE:
+                # Gradients are cheap to recompute, keep memory bounded
+                self.gradients.clear()
+            self.gradients[key] = vec
+        return vec
+
+    @staticmethod
+    def fade(value):
+        return 6 * value ** 5 - 15 * value ** 4 + 10 * value ** 3
+
+    def __call__(self, xs, ys):
+        """Noise for every (x, y) of the grid spanned by xs and ys, shape (len(ys), len(xs))"""
+        xs = np.asarray(xs, dtype=np.float64) * self.octaves
+        ys = np.asarray(ys, dtype=np.float64) * self.octaves
+        x0 = np.floor(xs).astype(np.int64)
+        y0 = np.floor(ys).astype(np.int64)
+
+        # Gradient table covering every lattice point the grid touches
+        min_x, max_x = int(x0.min()), int(x0.max()) + 1
+        min_y, max_y = int(y0.min()), int(y0.max()) + 1
+        grad = np.empty((max_y - min_y + 1, max_x - min_x + 1, 2))
+        for iy in range(min_y, max_y + 1):
+            for ix in range(min_x, max_x + 1):
+                grad[iy - min_y, ix - min_x] = self.get_gradient(ix, iy)
+
+        result = np.zeros((len(ys), len(xs)))
+        # Corner order matches itertools.product in PerlinNoise.noise
+        for cx in (0, 1):
+            dx = xs - (x0 + cx)
+            wx = self.fade(1 - np.abs(dx))
+            gx_index = x0 + cx - min_x
+            for cy in (0, 1):
+                dy = ys - (y0 + cy)
+                wy = self.fade(1 - np.abs(dy))
+                corner = grad[(y0 + cy - min_y)[:, None], gx_index[None, :]]
+                dot = corner[..., 0] * dx[None, :] + corner[..., 1] * dy[:, None]
+                result += (wx[None, :] * wy[:, None]) * dot
+        return result
+
+
+def classify_biomes(height, biome_value):
+    """Determine biomes from height and biome noise arrays, returns Biome values"""
+    # Normalize biome value to 0-1
+    biome_value = (biome_value + 1) / 2
+    highland = height > 0.75
+    conditions = [
+        height < 0.3,
+        highland & (biome_value < 0.3),
+        highland & (biome_value < 0.7),
+        highland,
+        height < 0.4,
+        biome_value < 0.2,
+        biome_value < 0.4,
+        biome_value < 0.6,
+        biome_value < 0.8,
+    ]
+    choices = [
+        Biome.OCEAN.value,
+        Biome.TUNDRA.value,
+        Biome.MOUNTAINS.value,
+        Biome.VOLCANIC.value,
+        Biome.SWAMP.value,
+        Biome.TUNDRA.value,
+        Biome.FOREST.value,
+        Biome.PLAINS.value,
+        Biome.DESERT.value,
+    ]
+    return np.select(conditions, choices, default=Biome.FOREST.value).astype(np.uint8)
+
+
+class ChunkNoise:
+    """Noise samples for every tile of one chunk, arrays indexed [local_y, local_x]"""
+
+    def __init__(self, height, biome_value, feature_value, biomes):
+        self.height = height
+        self.biome_value = biome_value
+        self.feature_value = feature_value
+        self.biomes = biomes  # Biome values, see BIOME_BY_CODE
+
+
+# Spatial index for entities
+class SpatialGroup(pygame.sprite.Group):
+    """Sprite group that also files its sprites in a uniform grid by rect center.
+
+    Adding and removing (including Sprite.kill) keep the grid in sync; call
+    reindex after a sprite moves. Radius and nearest queries only look at the
+    cells the radius covers, so their cost follows local density rather than
+    the size of the group.
+    """
+
+    def __init__(self, *sprites, cell_size=SPATIAL_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}  # (cell_x, cell_y) -> sprites (a dict used as an ordered set)
+        self.sprite_cells = {}  # sprite -> (cell_x, cell_y)
+        super().__init__(*sprites)
+
+    def copy(self):
+        return self.__class__(*self.sprites(), cell_size=self.cell_size)
+
+    def get_cell(self, sprite):
+        return sprite.rect.centerx // self.cell_size, sprite.rect.centery // self.cell_size
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        cell = self.get_cell(sprite)
+        self.sprite_cells[sprite] = cell
+        self.cells.setdefault(cell, {})[sprite] = None
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        cell = self.sprite_cells.pop(sprite, None)
+        if cell is not None:
+            members = self.cells[cell]
+            members.pop(sprite, None)
+            if not members:
+                del self.cells[cell]
+
+    def reindex(self, sprite):
+        """Move a sprite to the cell of its current position"""
+        old_cell = self.sprite_cells.get(sprite)
+        if old_cell is None:
+            return
+        cell = self.get_cell(sprite)
+        if cell != old_cell:
+            members = self.cells[old_cell]
+            members.pop(sprite, None)
+            if not members:
+                del self.cells[old_cell]
+            self.sprite_cells[sprite] = cell
+            self.cells.setdefault(cell, {})[sprite] = None
+
+    def query_rect(self, rect):
+        """Get the sprites filed in cells overlapping a pixel rect"""
+        found = []
+        for cell_y in range(rect.top // self.cell_size, (rect.bottom - 1) // self.cell_size + 1):
+            for cell_x in range(rect.left // self.cell_size, (rect.right - 1) // self.cell_size + 1):
+                members = self.cells.get((cell_x, cell_y))
+                if members:
+                    found.extend(members)
+        return found
+
+    def get_in_radius(self, x, y, radius):
+        """Get the sprites whose center is within radius pixels of (x, y)"""
+        radius_sq = radius * radius
+        candidates = self.query_rect(pygame.Rect(int(x - radius), int(y - radius),
+                                                 int(2 * radius) + 2, int(2 * radius) + 2))
+        return [sprite for sprite in candidates
+                if (sprite.rect.centerx - x) ** 2 + (sprite.rect.centery - y) ** 2 <= radius_sq]
+
+    def get_nearest(self, x, y, radius):
+        """Get the sprite nearest to (x, y) that is strictly closer than radius pixels, or None"""
+        nearest = None
+        min_dist_sq = radius * radius
+        for sprite in self.get_in_radius(x, y, radius):
+            dist_sq = (sprite.rect.centerx - x) ** 2 + (sprite.rect.centery - y) ** 2
+            if dist_sq < min_dist_sq:
+                min_dist_sq = dist_sq
+                nearest = sprite
+        return nearest
+
+
+# Shared pathfinding toward the player
+class FlowField:
+    """Walking distances to a target tile over the loaded chunks around it.
+
+    One breadth-first search over the passability of the chunks within `radius`
+    of the target serves every monster heading for the target: each one steps to
+    the neighbouring tile with the smallest distance. The field is recomputed
+    lazily, on the first query after the target changes tile or terrain changes.
+    """
+
+    # Neighbour offsets, orthogonal first so they win ties
+    STEPS = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, 1), (1, -1), (-1, -1))
+
+    def __init__(self, game_map, radius=FLOW_FIELD_RADIUS):
+        self.game_map = game_map
+        self.radius = radius
+        self.target_tile = None
+        self.field_tile = None  # Target tile the distances were computed for
+        self.field_version = None  # Terrain version the distances were computed for
+        self.left = self.top = self.width = 0
+        self.distances = []  # Flat [y * width + x] steps to the target, -1 if unreachable
+        self.recomputes = 0
+
+    def set_target(self, tile_x, tile_y):
+        """Move the target; distances are recomputed when next needed"""
+        self.target_tile = (tile_x, tile_y)
+
+    def refresh(self):
+        """Recompute the distances if the target or the terrain changed"""
+        if self.field_tile == self.target_tile and self.field_version == self.game_map.terrain_version:
+            return
+        self.field_tile = self.target_tile
+        self.field_version = self.game_map.terrain_version
+        self.recomputes += 1
+
+        size = self.game_map.chunk_size
+        target_x, target_y = self.target_tile
+        self.left = (target_x // size - self.radius) * size
+        self.top = (target_y // size - self.radius) * size
+        self.width = width = (2 * self.radius + 1) * size
+        cells = width * width
+
+        passable = self.game_map.get_passable_region(self.left, self.top, width, width).ravel().tolist()
+        distances = [-1] * cells
+        start = (target_y - self.top) * width + (target_x - self.left)
+        distances[start] = 0
+        queue = deque([start])
+
+        while queue:
+            index = queue.popleft()
+            distance = distances[index] + 1
+            x = index % width
+            for neighbour in (index - 1 if x > 0 else -1, index + 1 if x < width - 1 else -1,
+                              index - width, index + width):
+                if 0 <= neighbour < cells and distances[neighbour] < 0 and passable[neighbour]:
+                    distances[neighbour] = distance
+                    queue.append(neighbour)
+
+        self.distances = distances
+
+    def get_distance(self, tile_x, tile_y):
+        """Get the walking distance in steps from a tile to the target, -1 if unknown or unreachable"""
+        x, y = tile_x - self.left, tile_y - self.top
+        if 0 <= x < self.width and 0 <= y < self.width:
+            return self.distances[y * self.width + x]
+        return -1
+
+    def get_next_tile(self, tile_x, tile_y):
+        """Get the neighbouring tile one step closer to the target, or None if there is none.
+
+        Diagonal steps are only taken when both tiles beside the diagonal are walkable.
+        """
+        if self.target_tile is None:
+            return None
+        self.refresh()
+
+        best = None
+        best_distance = self.get_distance(tile_x, tile_y)
+        if best_distance < 0:
+            return None
+
+        for step_x, step_y in self.STEPS:
+            distance = self.get_distance(tile_x + step_x, tile_y + step_y)
+            if distance < 0 or distance >= best_distance:
+                continue
+            if step_x and step_y and (self.get_distance(tile_x + step_x, tile_y) < 0
+                                      or self.get_distance(tile_x, tile_y + step_y) < 0):
+                continue
+            best = (tile_x + step_x, tile_y + step_y)
+            best_distance = distance
+
+        return best
+
+
+# Time-sliced A* for individual monsters
+class PathfindingService:
+    """Queue of A* path requests, worked through under a per-frame time budget.
+
+    Searches run on the passability of the box around start and goal. Results are
+    cached by (start tile, goal tile), with () for a goal that cannot be reached,
+    and dropped when a chunk they cross has changed or been evicted since. A
+    monster asking for a path gets a cached one at once, or has it written to
+    monster.path when its search runs; monster.path_goal tells which goal it is
+    waiting for.
+    """
+
+    # Neighbour offsets and step costs
+    STEPS = ((1, 0, 1.0), (-1, 0, 1.0), (0, 1, 1.0), (0, -1, 1.0),
+             (1, 1, 1.414), (-1, 1, 1.414), (1, -1, 1.414), (-1, -1, 1.414))
+
+    def __init__(self, game_map, budget_ms=PATHFINDING_BUDGET_MS, cache_size=PATH_CACHE_SIZE, max_searches=None):
+        self.game_map = game_map
+        self.budget = budget_ms / 1000
+        self.max_searches = max_searches  # Searches per frame instead of the time budget, if set
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # (start, goal) -> (path, chunks crossed, terrain version)
+        self.queue = deque()  # (monster, start, goal)
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.searches = 0
+
+    @property
+    def queue_depth(self):
+        """Number of searches waiting to run"""
+        return len(self.queue)
+
+    @property
+    def hit_rate(self):
+        """Fraction of requests answered from the cache"""
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
+
+    def request(self, monster, start, goal):
+        """Ask for a path of tiles from start to goal (excluding start) for a monster
+
+        Returns the path if it is cached (empty if the goal is unreachable), otherwise
+        queues a search and returns None.
+        """
+        monster.path_goal = goal
+        path = self.get_cached(start, goal)
+        if path is not None:
+            self.hits += 1
+            if not path:
+                monster.path_goal = None
+            return list(path)
+        self.misses += 1
+        self.queue.append((monster, start, goal))
+        return None
+
+    def get_cached(self, start, goal):
+        """Get a cached path that no terrain change has invalidated, or None if there is none"""
+        entry = self.cache.get((start, goal))
+        if entry is None:
+            return None
+        path, chunks, version = entry
+        chunk_versions = self.game_map.chunk_versions
+        if any(chunk_versions.get(chunk, 0) > version for chunk in chunks):
+            del self.cache[(start, goal)]
+            return None
+        self.cache.move_to_end((start, goal))
+        return path
+
+    def process(self):
+        """Run queued searches until the frame's time budget (or search limit) is spent"""
+        deadline = time.perf_counter() + self.budget
+        searches = self.searches
+        while self.queue:
+            if self.max_searches is None:
+                if time.perf_counter() >= deadline:
+                    break
+            elif self.searches - searches >= self.max_searches:
+                break
+
+            monster, start, goal = self.queue.popleft()
+
+            # Skip monsters that died or asked for another path meanwhile
+            if not monster.alive() or monster.path_goal != goal:
+                continue
+
+            path = self.get_cached(start, goal)
+            if path is None:
+                path = self.find_path(start, goal)
+            monster.path = list(path)
+            if not path:
+                monster.path_goal = None
+
+    def find_path(self, start, goal):
+        """A* from start to goal tile inside the box around them, caching the result (() if no path)"""
+        self.searches += 1
+        version = self.game_map.terrain_version
+
+        left = min(start[0], goal[0]) - PATH_SEARCH_MARGIN
+        top = min(start[1], goal[1]) - PATH_SEARCH_MARGIN
+        width = abs(start[0] - goal[0]) + 2 * PATH_SEARCH_MARGIN + 1
+        height = abs(start[1] - goal[1]) + 2 * PATH_SEARCH_MARGIN + 1
+        passable = self.game_map.get_passable_region(left, top, width, height).tolist()
+
+        path = self.search(passable, (start[0] - left, start[1] - top), (goal[0] - left, goal[1] - top))
+        path = tuple((x + left, y + top) for x, y in path) if path is not None else ()
+
+        size = self.game_map.chunk_size
+        chunks = [(chunk_x, chunk_y)
+                  for chunk_y in range(top // size, (top + height - 1) // size + 1)
+                  for chunk_x in range(left // size, (left + width - 1) // size + 1)]
+        self.cache[(start, goal)] = (path, chunks, version)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return path
+
+    def drop_chunks(self, chunks):
+        """Forget the cached paths that cross any of the given chunks"""
+        chunks = set(chunks)
+        for key in [key for key, (_, crossed, _) in self.cache.items() if not chunks.isdisjoint(crossed)]:
+            del self.cache[key]
+
+    def search(self, passable, start, goal):
+        """A* over a passability grid indexed [y][x], without cutting corners
+
+        Returns the tiles after start up to goal, or None if goal cannot be reached.
+        """
+        goal_x, goal_y = goal
+        height, width = len(passable), len(passable[0])
+        if not passable[goal_y][goal_x]:
+            return None
+
+        def estimate(x, y):
+            dx, dy = abs(x - goal_x), abs(y - goal_y)
+            return max(dx, dy) + 0.414 * min(dx, dy)
+
+        costs = {start: 0.0}
+        came_from = {}
+        open_heap = [(estimate(*start), start)]
+
+        while open_heap:
+            _, current = heapq.heappop(open_heap)
+            if current == goal:
+                path = []
+                while current != start:
+                    path.append(current)
+                    current = came_from[current]
+                path.reverse()
+                return path
+
+            x, y = current
+            cost = costs[current]
+            for step_x, step_y, step_cost in self.STEPS:
+                next_x, next_y = x + step_x, y + step_y
+                if not (0 <= next_x < width and 0 <= next_y < height) or not passable[next_y][next_x]:
+                    continue
+                if step_x and step_y and not (passable[y][next_x] and passable[next_y][x]):
+                    continue
+                next_cost = cost + step_cost
+                if next_cost < costs.get((next_x, next_y), float("inf")):
+                    costs[(next_x, next_y)] = next_cost
+                    came_from[(next_x, next_y)] = current
+                    heapq.heappush(open_heap, (next_cost + estimate(next_x, next_y), (next_x, next_y)))
+
+        return None
+
+
+# Vectorized monster movement
+class MonsterMovementBatch:
+    """Structure-of-arrays movement step for all monsters updated in a frame.
+
+    While collecting, Monster.move_toward only records its target. step() then
+    gathers positions, targets and speeds into NumPy arrays, runs steering,
+    normalization and the per-axis tile collision of move_toward for every
+    monster at once against one passability array, and writes positions and
+    directions back to the sprites, so their rects stay what drawing and the
+    spatial grid read.
+    """
+
+    DIRECTIONS = np.array(["up", "down", "left", "right"])
+
+    def __init__(self, game_map):
+        self.game_map = game_map
+        self.collecting = False
+        self.monsters = []
+        self.moves = []  # (x, y, width, height, target x, target y, speed) per recorded move
+        self.steps = 0  # Batched steps run
+
+    def begin(self):
+        """Start recording moves"""
+        self.collecting = True
+        self.monsters = []
+        self.moves = []
+
+    def add(self, monster, target_pos):
+        """Record a move of a monster toward a position"""
+        rect = monster.rect
+        self.monsters.append(monster)
+        self.moves.append((rect.x, rect.y, rect.width, rect.height, target_pos[0], target_pos[1], monster.move_speed))
+
+    @staticmethod
+    def round_half_away(values):
+        """Round like assigning floats to pygame.Rect does"""
+        return np.copysign(np.floor(np.abs(values) + 0.5), values)
+
+    def step(self):
+        """Stop recording and carry out all recorded moves"""
+        self.collecting = False
+        if not self.monsters:
+            return
+        self.steps += 1
+        monsters = self.monsters
+
+        # Gather
+        moves = np.array(self.moves, dtype=np.float64)
+        x, y, speeds = moves[:, 0], moves[:, 1], moves[:, 6]
+        half_w, half_h = moves[:, 2] // 2, moves[:, 3] // 2
+
+        # Steer
+        dx = moves[:, 4] - (x + half_w)
+        dy = moves[:, 5] - (y + half_h)
+        dist = np.hypot(dx, dy)
+        moving = dist > 0
+        dist[~moving] = 1
+        velocity = speeds * PLAYER_SPEED * 0.8 / dist
+        new_x = x + dx * velocity
+        new_y = y + dy * velocity
+
+        # One passability array covering every tile the moves can touch
+        tile_new_x = np.trunc(new_x + half_w) // TILE_SIZE
+        tile_new_y = np.trunc(new_y + half_h) // TILE_SIZE
+        tile_x = (x + half_w) // TILE_SIZE
+        tile_y = (y + half_h) // TILE_SIZE
+        # (one tile wider, as rounding a position can carry it past the tile it was checked at)
+        left = int(min(tile_new_x.min(), tile_x.min())) - 1
+        top = int(min(tile_new_y.min(), tile_y.min())) - 1
+        width = int(max(tile_new_x.max(), tile_x.max())) - left + 2
+        height = int(max(tile_new_y.max(), tile_y.max())) - top + 2
+        passable = self.game_map.get_passable_region(left, top, width, height)
+
+        # Collide per axis, X first like move_toward
+        pass_x = moving & passable[(tile_y - top).astype(int), (tile_new_x - left).astype(int)]
+        x = np.where(pass_x, self.round_half_away(new_x), x)
+        tile_x = (x + half_w) // TILE_SIZE
+        pass_y = moving & passable[(tile_new_y - top).astype(int), (tile_x - left).astype(int)]
+        y = np.where(pass_y, self.round_half_away(new_y), y)
+
+        # Facing, as move_toward sets it
+        horizontal = np.abs(dx) > np.abs(dy)
+        facing = np.where(horizontal, np.where(dx > 0, 3, 2), np.where(dy > 0, 1, 0))
+        directions = self.DIRECTIONS[facing]
+
+        # Scatter back to the sprites
+        for monster, new_x, new_y, direction, moved in zip(monsters, x.astype(int).tolist(), y.astype(int).tolist(),
+                                                            directions.tolist(), moving.tolist()):
+            if moved:
+                monster.rect.topleft = (new_x, new_y)
+                monster.direction = direction
+
+        self.monsters = []
+        self.moves = []
+
+
+# On-disk chunk storage
+class ChunkStore:
+    """Evicted chunks kept in memory-mapped region files on disk.
+
+    Each region file holds REGION_SIZE x REGION_SIZE chunks at fixed slots, so
+    a chunk is found from its coordinates alone and no per-chunk index has to
+    stay in memory. A record is a small header (present flag and village
+    center) followed by the chunk's terrain codes.
+    """
+
+    HEADER = struct.Struct("<BBxxii")  # present, has village, village x, village y
+
+    def __init__(self, chunk_size, directory=None, max_open_regions=4):
+        self.chunk_size = chunk_size
+        self.tile_bytes = chunk_size * chunk_size
+        self.record_size = self.HEADER.size + self.tile_bytes
+        self.owns_directory = directory is None
+        self.directory = directory or tempfile.mkdtemp(prefix="rpg_chunks_")
+        self.max_open_regions = max_open_regions
+        self.regions = OrderedDict()  # (region_x, region_y) -> (file, mmap), most recent last
+        self.region_files = set()  # Regions that exist on disk
+
+    def get_region_path(self, region_x, region_y):
+        return os.path.join(self.directory, f"r.{region_x}.{region_y}.bin")
+
+    def open_region(self, region_x, region_y, create=False):
+        """Get the memory map of a region file, or None if it does not exist"""
+        key = (region_x, region_y)
+        if key in self.regions:
+            self.regions.move_to_end(key)
+            return self.regions[key][1]
+
+        path = self.get_region_path(region_x, region_y)
+        if key not in self.region_files:
+            if not create:
+                return None
+            with open(path, "wb") as region_file:
+                region_file.truncate(REGION_SIZE * REGION_SIZE * self.record_size)
+            self.region_files.add(key)
+
+        # Close the least recently used region if too many are open
+        if len(self.regions) >= self.max_open_regions:
+            _, (old_file, old_map) = self.regions.popitem(last=False)
+            old_map.close()
+            old_file.close()
+
+        region_file = open(path, "r+b")
+        region_map = mmap.mmap(region_file.fileno(), 0)
+        self.regions[key] = (region_file, region_map)
+        return region_map
+
+    def locate(self, chunk_x, chunk_y):
+        """Get the region and byte offset of a chunk's record"""
+        slot = (chunk_y % REGION_SIZE) * REGION_SIZE + chunk_x % REGION_SIZE
+        return (chunk_x // REGION_SIZE, chunk_y // REGION_SIZE), slot * self.record_size
+
+    def save(self, chunk_x, chunk_y, tiles, village_center=None):
+        """Write a chunk's terrain codes and village center"""
+        (region_x, region_y), offset = self.locate(chunk_x, chunk_y)
+        region_map = self.open_region(region_x, region_y, create=True)
+        village_x, village_y = village_center or (0, 0)
+        self.HEADER.pack_into(region_map, offset, 1, village_center is not None, village_x, village_y)
+        start = offset + self.HEADER.size
+        region_map[start:start + self.tile_bytes] = tiles.tobytes()
+
+    def load(self, chunk_x, chunk_y):
+        """Read a chunk back, returns (tiles, village_center) or None if it was never saved"""
+        (region_x, region_y), offset = self.locate(chunk_x, chunk_y)
+        region_map = self.open_region(region_x, region_y)
+        if region_map is None:
+            return None
+        present, has_village, village_x, village_y = self.HEADER.unpack_from(region_map, offset)
+        if not present:
+            return None
+        tiles = np.frombuffer(region_map, dtype=np.uint8, count=self.tile_bytes,
+                              offset=offset + self.HEADER.size).reshape(self.chunk_size, self.chunk_size).copy()
+        village_center = (village_x, village_y) if has_village else None
+        return tiles, village_center
+
+    def close(self):
+        """Close all region files and delete the store if it was temporary"""
+        for region_file, region_map in self.regions.values():
+            region_map.close()
+            region_file.close()
+        self.regions.clear()
+        if self.owns_directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
 # Map class
 class GameMap:
-    def __init__(self):
-        self.terrain_map = {}  # Store terrain data
+    def __init__(self, synchronous=False):
+        self.terrain_map = {}  # Terrain codes per chunk, uint8 arrays indexed [local_y, local_x]
+        self.passable_map = {}  # Passability mask per chunk, parallel to terrain_map
         self.chunk_size = CHUNK_SIZE  # Chunk size
-        self.generated_chunks = set()  # Keep track of generated chunks
+        self.generated_chunks = set()  # Keep track of chunks resident in memory
+        self.chunk_lru = OrderedDict()  # Resident chunks, least recently used first
+        self.chunk_store = ChunkStore(self.chunk_size) if PERSIST_EVICTED_CHUNKS else None  # Evicted chunks
+        self.chunk_surfaces = OrderedDict()  # Pre-rendered chunks, least recently drawn first
+        self.chunk_surface_cache_size = CHUNK_SURFACE_CACHE_SIZE  # Grown by draw to fit the view
+        self.terrain_version = 0  # Bumped whenever loaded terrain changes, for data derived from it
+        self.chunk_versions = {}  # Loaded chunk -> terrain_version of its last change
 
         # Initialize random seeds
         self.seed = random.randint(0, 999999)
@@ -952,6 +2175,12 @@ class GameMap:
         self.biome_noise = PerlinNoise(octaves=4, seed=biome_seed)
         self.feature_noise = PerlinNoise(octaves=5, seed=feature_seed)
 
+        # Batched evaluators used for whole-chunk generation
+        self.height_field = PerlinField(self.height_noise)
+        self.detail_field = PerlinField(self.detail_noise)
+        self.biome_field = PerlinField(self.biome_noise)
+        self.feature_field = PerlinField(self.feature_noise)
+
         # Noise parameters
         self.height_scale = 150.0
         self.detail_scale = 50.0
@@ -962,272 +2191,411 @@ class GameMap:
         self.village_density = 0.03
         self.village_locations = {}
 
-    def get_height(self, x, y):
-        """Get terrain height value (0-1)"""
-        # Base low-frequency noise
-        base = self.height_noise([x / self.height_scale, y / self.height_scale])
+        # Per-chunk noise samples, released when a chunk leaves the loaded area
+        self.noise_cache = {}
+
+        # Background chunk generation: workers build chunks, the main thread
+        # stores them in integrate_ready_chunks
+        self.chunk_executor = ThreadPoolExecutor(max_workers=CHUNK_WORKERS, thread_name_prefix="chunkgen")
+        self.pending_chunks = {}  # (chunk_x, chunk_y) -> Future of build_chunk result
+
+        # Generate requested chunks at once instead, so runs repeat frame for frame
+        self.synchronous = synchronous
+
+        # Chunk the loaded area is kept around (the player's), set by the game
+        self.center_chunk = (0, 0)
+
+    def touch_chunk(self, key):
+        """Mark a resident chunk as recently used"""
+        self.chunk_lru.move_to_end(key)
+
+    def request_chunk(self, chunk_x, chunk_y):
+        """Queue a chunk for background generation, returns True if it is already loaded (or synchronous)"""
+        key = (chunk_x, chunk_y)
+        if key in self.terrain_map:
+            self.touch_chunk(key)
+            return True
+        if key in self.pending_chunks:
+            return False
+        if self.load_chunk(chunk_x, chunk_y):
+            return True
+        if self.synchronous:
+            self.ensure_chunk(chunk_x, chunk_y)
+            return True
+        self.pending_chunks[key] = self.chunk_executor.submit(self.build_chunk, chunk_x, chunk_y)
+        return False
+
+    def integrate_ready_chunks(self):
+        """Store chunks that finished building in the background"""
+        ready = [key for key, future in self.pending_chunks.items() if future.done()]
+        for key in ready:
+            future = self.pending_chunks.pop(key)
+            if key not in self.terrain_map:
+                self.add_built_chunk(key[0], key[1], *future.result())
+        return ready
+
+    def ensure_chunk(self, chunk_x, chunk_y):
+        """Generate a chunk now, reusing its background result if one is pending"""
+        key = (chunk_x, chunk_y)
+        if key in self.terrain_map or self.load_chunk(chunk_x, chunk_y):
+            return
+        future = self.pending_chunks.pop(key, None)
+        if future is not None:
+            self.add_built_chunk(chunk_x, chunk_y, *future.result())
+        else:
+            self.generate_chunk(chunk_x, chunk_y)
+
+    def load_chunk(self, chunk_x, chunk_y):
+        """Reload an evicted chunk from the chunk store, returns True if it was stored"""
+        if self.chunk_store is None:
+            return False
+        stored = self.chunk_store.load(chunk_x, chunk_y)
+        if stored is None:
+            return False
+        tiles, village_center = stored
+        if village_center is not None:
+            self.village_locations[(chunk_x, chunk_y)] = village_center
+        self.store_chunk(chunk_x, chunk_y, tiles)
+        return True
 
-        # High-frequency detail noise
-        detail = self.detail_noise([x / self.detail_scale, y / self.detail_scale])
+    def unload_chunk(self, chunk_x, chunk_y):
+        """Drop everything held for a chunk in memory, writing it to the chunk store if there is one.
 
-        # Blend noises
-        height = base * 0.7 + detail * 0.3
+        Without a store the chunk is simply regenerated from the seed on revisit.
+        """
+        key = (chunk_x, chunk_y)
+        tiles = self.terrain_map.pop(key)
+        village_center = self.village_locations.pop(key, None)
+        if self.chunk_store is not None:
+            self.chunk_store.save(chunk_x, chunk_y, tiles, village_center)
+        del self.passable_map[key]
+        del self.chunk_lru[key]
+        self.generated_chunks.discard(key)
+        self.noise_cache.pop(key, None)
+        self.invalidate_chunk_surface(chunk_x, chunk_y)
+        self.mark_terrain_changed(chunk_x, chunk_y)
+        del self.chunk_versions[key]
+
+    def evict_chunks(self, center_chunk_x, center_chunk_y, radius=CHUNK_KEEP_RADIUS,
+                     max_resident=MAX_RESIDENT_CHUNKS):
+        """Evict least recently used chunks outside radius until at most max_resident remain"""
+        excess = len(self.terrain_map) - max_resident
+        evicted = []
+        if excess <= 0:
+            return evicted
+        for chunk_x, chunk_y in list(self.chunk_lru):
+            if excess <= 0:
+                break
+            if abs(chunk_x - center_chunk_x) <= radius and abs(chunk_y - center_chunk_y) <= radius:
+                continue
+            self.unload_chunk(chunk_x, chunk_y)
+            evicted.append((chunk_x, chunk_y))
+            excess -= 1
+        return evicted
+
+    def shutdown(self):
+        """Stop background chunk generation and remove the chunk store"""
+        self.chunk_executor.shutdown(wait=False, cancel_futures=True)
+        self.pending_chunks.clear()
+        if self.chunk_store is not None:
+            self.chunk_store.close()
+
+    def get_chunk_noise(self, chunk_x, chunk_y):
+        """Get the cached noise samples of a chunk, sampling it on first use"""
+        noise = self.noise_cache.get((chunk_x, chunk_y))
+        if noise is None:
+            noise = self.sample_chunk_noise(chunk_x, chunk_y)
+            self.noise_cache[(chunk_x, chunk_y)] = noise
+        return noise
+
+    def release_noise_outside(self, center_chunk_x, center_chunk_y, radius=NOISE_CACHE_RADIUS):
+        """Drop noise samples of chunks farther than radius from the center chunk"""
+        if len(self.noise_cache) <= (2 * radius + 1) ** 2:
+            return
+        for chunk_x, chunk_y in list(self.noise_cache):
+            if abs(chunk_x - center_chunk_x) > radius or abs(chunk_y - center_chunk_y) > radius:
+                del self.noise_cache[(chunk_x, chunk_y)]
 
-        # Normalize to 0-1
-        height = (height + 1) / 2
+    def get_tile_noise(self, x, y):
+        """Get the cached noise samples and local index for a tile"""
+        noise = self.get_chunk_noise(x // self.chunk_size, y // self.chunk_size)
+        return noise, (y % self.chunk_size, x % self.chunk_size)
 
-        return height
+    def get_height(self, x, y):
+        """Get terrain height value (0-1)"""
+        noise, index = self.get_tile_noise(x, y)
+        return float(noise.height[index])
 
     def get_biome_value(self, x, y):
         """Get biome noise value"""
-        return self.biome_noise([x / self.biome_scale, y / self.biome_scale])
+        noise, index = self.get_tile_noise(x, y)
+        return float(noise.biome_value[index])
 
     def get_feature_value(self, x, y):
         """Get feature noise value (for rivers, lakes, etc.)"""
-        return self.feature_noise([x / self.feature_scale, y / self.feature_scale])
+        noise, index = self.get_tile_noise(x, y)
+        return float(noise.feature_value[index])
 
     def determine_biome(self, x, y):
-        """Determine biome based on noise value and height"""
-        height = self.get_height(x, y)
-        biome_value = self.get_biome_value(x, y)
-
-        # Ocean and water bodies
-        if height < 0.3:
-            return Biome.OCEAN
-
-        # Normalize biome value to -1 to 1
-        biome_value = (biome_value + 1) / 2
-
-        # Mountain regions (based on height)
-        if height > 0.75:
-            if biome_value < 0.3:
-                return Biome.TUNDRA
-            elif biome_value < 0.7:
-                return Biome.MOUNTAINS
-            else:
-                return Biome.VOLCANIC
-
-        # Other biomes (based on biome noise)
-        if height < 0.4:
-            return Biome.SWAMP
-        elif biome_value < 0.2:
-            return Biome.TUNDRA
-        elif biome_value < 0.4:
-            return Biome.FOREST
-        elif biome_value < 0.6:
-            return Biome.PLAINS
-        elif biome_value < 0.8:
-            return Biome.DESERT
-        else:
-            return Biome.FOREST
+        """Determine biome based on noise value and height (see classify_biomes)"""
+        noise, index = self.get_tile_noise(x, y)
+        return BIOME_BY_CODE[int(noise.biomes[index])]
+
+    def get_chunk_key(self, chunk_x, chunk_y):
+        """Get the key of a loaded chunk, or None while it is not ready.
+
+        A missing chunk within CHUNK_KEEP_RADIUS of center_chunk is queued for
+        background generation instead of being generated on the calling frame.
+        Lookups farther out never extend the world and only get None.
+        """
+        key = (chunk_x, chunk_y)
+        if key in self.terrain_map:
+            return key
+        center_x, center_y = self.center_chunk
+        if abs(chunk_x - center_x) > CHUNK_KEEP_RADIUS or abs(chunk_y - center_y) > CHUNK_KEEP_RADIUS:
+            return None
+        if self.request_chunk(chunk_x, chunk_y):
+            return key
+        return None
 
     def get_terrain(self, x, y):
-        """Get terrain type at global coordinates"""
-        chunk_x = x // self.chunk_size
-        chunk_y = y // self.chunk_size
-        if (chunk_x, chunk_y) not in self.terrain_map:
-            self.generate_chunk(chunk_x, chunk_y)
-        local_x = x % self.chunk_size
-        local_y = y % self.chunk_size
-        return self.terrain_map[(chunk_x, chunk_y)][local_y][local_x]
+        """Get terrain type at global coordinates (None while the chunk is not ready, see get_chunk_key)"""
+        key = self.get_chunk_key(x // self.chunk_size, y // self.chunk_size)
+        if key is None:
+            return None
+        return TERRAIN_BY_CODE[self.terrain_map[key][y % self.chunk_size, x % self.chunk_size]]
 
     def is_passable(self, x, y):
         """Check if terrain is passable at global coordinates"""
-        terrain = self.get_terrain(x, y)
-        return TERRAIN_PASSABLE.get(terrain, True)
+        key = self.get_chunk_key(x // self.chunk_size, y // self.chunk_size)
+        if key is None:
+            # Nothing may enter a chunk that is still generating or out of range
+            return False
+        return bool(self.passable_map[key][y % self.chunk_size, x % self.chunk_size])
+
+    def get_passable_region(self, left, top, width, height):
+        """Passability of a tile rectangle as a bool array indexed [y - top, x - left].
+
+        Only loaded chunks are read; tiles of chunks that are missing or still
+        generating are reported as blocked.
+        """
+        region = np.zeros((height, width), dtype=bool)
+        size = self.chunk_size
+        for chunk_y in range(top // size, (top + height - 1) // size + 1):
+            for chunk_x in range(left // size, (left + width - 1) // size + 1):
+                mask = self.passable_map.get((chunk_x, chunk_y))
+                if mask is None:
+                    continue
+                # Overlap of this chunk with the region, in global tiles
+                x0 = max(left, chunk_x * size)
+                x1 = min(left + width, (chunk_x + 1) * size)
+                y0 = max(top, chunk_y * size)
+                y1 = min(top + height, (chunk_y + 1) * size)
+                region[y0 - top:y1 - top, x0 - left:x1 - left] = \
+                    mask[y0 - chunk_y * size:y1 - chunk_y * size, x0 - chunk_x * size:x1 - chunk_x * size]
+        return region
+
+    def sample_chunk_noise(self, chunk_x, chunk_y):
+        """Sample height, biome and feature noise for a whole chunk at once"""
+        xs = np.arange(chunk_x * self.chunk_size, (chunk_x + 1) * self.chunk_size, dtype=np.float64)
+        ys = np.arange(chunk_y * self.chunk_size, (chunk_y + 1) * self.chunk_size, dtype=np.float64)
+
+        # Same blend as get_height
+        base = self.height_field(xs / self.height_scale, ys / self.height_scale)
+        detail = self.detail_field(xs / self.detail_scale, ys / self.detail_scale)
+        height = (base * 0.7 + detail * 0.3 + 1) / 2
+
+        biome_value = self.biome_field(xs / self.biome_scale, ys / self.biome_scale)
+        feature_value = self.feature_field(xs / self.feature_scale, ys / self.feature_scale)
+
+        return ChunkNoise(height, biome_value, feature_value, classify_biomes(height, biome_value))
+
+    def get_chunk_rng(self, chunk_x, chunk_y):
+        """Random generator for a chunk, derived only from the map seed and chunk coordinates"""
+        return random.Random(f"{self.seed}:{chunk_x}:{chunk_y}")
 
     def generate_chunk(self, chunk_x, chunk_y):
         """Generate a new chunk of terrain"""
-        chunk = []
+        self.add_built_chunk(chunk_x, chunk_y, *self.build_chunk(chunk_x, chunk_y, self.noise_cache.get((chunk_x, chunk_y))))
+
+    def add_built_chunk(self, chunk_x, chunk_y, tiles, village_center, noise):
+        """Store the result of build_chunk"""
+        self.noise_cache[(chunk_x, chunk_y)] = noise
+        if village_center is not None:
+            self.village_locations[(chunk_x, chunk_y)] = village_center
+        self.store_chunk(chunk_x, chunk_y, tiles)
+
+    def build_chunk(self, chunk_x, chunk_y, noise=None):
+        """Build a chunk's terrain, returns (tiles, village_center, noise).
+
+        Only the map seed and chunk coordinates decide the result, so chunks can
+        be built in any order, on any thread, and rebuilt after eviction.
+        Nothing on the map is modified here.
+        """
+        rng = self.get_chunk_rng(chunk_x, chunk_y)
+        size = self.chunk_size
 
         # Check if we should place a village
-        should_place_village = random.random() < self.village_density
+        should_place_village = rng.random() < self.village_density
         village_center = None
 
         if should_place_village:
             # Place village somewhere in the chunk
-            local_x = random.randint(3, self.chunk_size - 4)
-            local_y = random.randint(3, self.chunk_size - 4)
-            village_center = (chunk_x * self.chunk_size + local_x, chunk_y * self.chunk_size + local_y)
-            self.village_locations[(chunk_x, chunk_y)] = village_center
-
-        # Generate terrain for each tile in the chunk
+            local_x = rng.randint(3, size - 4)
+            local_y = rng.randint(3, size - 4)
+            village_center = (chunk_x * size + local_x, chunk_y * size + local_y)
+
+        # Noise for the whole chunk
+        if noise is None:
+            noise = self.sample_chunk_noise(chunk_x, chunk_y)
+        height = noise.height
+
+        # Standard biome terrain, sampled for all tiles of a biome at once
+        rolls = np.array([rng.random() for _ in range(size * size)]).reshape(size, size)
+        tiles = np.zeros((size, size), dtype=np.uint8)
+        for code in np.unique(noise.biomes):
+            mask = noise.biomes == code
+            tiles[mask] = TERRAIN_SAMPLERS[BIOME_BY_CODE[int(code)]].choose_values(rolls[mask])
+
+        # Special features like rivers or lakes
+        ocean = noise.biomes == Biome.OCEAN.value
+        tiles[~ocean & (np.abs(noise.feature_value) > 0.8) & (height < 0.4)] = TerrainType.WATER.value
+
+        # Oceans depend on height only
+        tiles[ocean] = np.where(height[ocean] < 0.2, TerrainType.DEEP_WATER.value, TerrainType.WATER.value)
+
+        if village_center:
+            local_xs = np.arange(size) + chunk_x * size - village_center[0]
+            local_ys = np.arange(size) + chunk_y * size - village_center[1]
+            dist_to_village_sq = local_ys[:, None] ** 2 + local_xs[None, :] ** 2
+
+            # Roads/paths around houses (70% chance), houses within 3 tiles
+            path_rolls = np.array([rng.random() for _ in range(size * size)]).reshape(size, size)
+            tiles[(dist_to_village_sq <= 25) & (path_rolls < 0.7)] = TerrainType.PATH.value
+            tiles[dist_to_village_sq <= 9] = TerrainType.HOUSE.value
+            tiles[village_center[1] - chunk_y * size, village_center[0] - chunk_x * size] = \
+                TerrainType.VILLAGE_CENTER.value
+
+        return tiles, village_center, noise
+
+    def store_chunk(self, chunk_x, chunk_y, tiles):
+        """Store a chunk's terrain codes and derive its passability mask"""
+        self.terrain_map[(chunk_x, chunk_y)] = tiles
+        self.passable_map[(chunk_x, chunk_y)] = TERRAIN_PASSABLE_CODES[tiles]
+        self.generated_chunks.add((chunk_x, chunk_y))
+        self.chunk_lru[(chunk_x, chunk_y)] = None
+        self.invalidate_chunk_surface(chunk_x, chunk_y)
+        self.mark_terrain_changed(chunk_x, chunk_y)
+
+    def set_terrain(self, x, y, terrain):
+        """Change the terrain of a loaded tile"""
+        key = self.get_chunk_key(x // self.chunk_size, y // self.chunk_size)
+        if key is None:
+            return
+        local_y, local_x = y % self.chunk_size, x % self.chunk_size
+        self.terrain_map[key][local_y, local_x] = terrain.value
+        self.passable_map[key][local_y, local_x] = TERRAIN_PASSABLE_CODES[terrain.value]
+        self.invalidate_chunk_surface(*key)
+        self.mark_terrain_changed(*key)
+
+    def invalidate_chunk_surface(self, chunk_x, chunk_y):
+        """Forget the pre-rendered surface of a chunk whose terrain changed"""
+        self.chunk_surfaces.pop((chunk_x, chunk_y), None)
+
+    def mark_terrain_changed(self, chunk_x, chunk_y):
+        """Record that the loaded terrain of a chunk changed, for data derived from it"""
+        self.terrain_version += 1
+        self.chunk_versions[(chunk_x, chunk_y)] = self.terrain_version
+
+    def get_chunk_surface(self, chunk_x, chunk_y):
+        """Get the pre-rendered (surface, overhang) of a loaded chunk, rendering it on first use"""
+        key = (chunk_x, chunk_y)
+        rendered = self.chunk_surfaces.get(key)
+        if rendered is not None:
+            self.chunk_surfaces.move_to_end(key)
+            return rendered
+
+        chunk_pixels = self.chunk_size * TILE_SIZE
+        overhang_height = TERRAIN_ATLAS.overhang
+
+        # Render with room above the chunk for roofs and tree tops of the top row
+        canvas = pygame.Surface((chunk_pixels, chunk_pixels + overhang_height), pygame.SRCALPHA)
+        tiles = self.terrain_map[key].tolist()
         for local_y in range(self.chunk_size):
-            row = []
             for local_x in range(self.chunk_size):
-                # Calculate global coordinates
-                global_x = chunk_x * self.chunk_size + local_x
-                global_y = chunk_y * self.chunk_size + local_y
+                TERRAIN_ATLAS.draw(canvas, tiles[local_y][local_x],
+                                   local_x * TILE_SIZE, local_y * TILE_SIZE + overhang_height)
+
+        # The chunk itself is opaque; only a top row with tall tiles needs an alpha overhang
+        surface = canvas.subsurface((0, overhang_height, chunk_pixels, chunk_pixels)).copy().convert()
+        overhang = None
+        if any(TERRAIN_BY_CODE[code] in OVERHANGING_TERRAIN for code in tiles[0]):
+            overhang = canvas.subsurface((0, 0, chunk_pixels, overhang_height)).copy()
+
+        rendered = (surface, overhang)
+        self.chunk_surfaces[key] = rendered
+        if len(self.chunk_surfaces) > self.chunk_surface_cache_size:
+            self.chunk_surfaces.popitem(last=False)
+        return rendered
+
+    def get_visible_tile_bounds(self, camera):
+        """Get the (left, top, right, bottom) tile range seen by the camera, right and bottom exclusive"""
+        view_left = -camera.rect.x
+        view_top = -camera.rect.y
+        left = view_left // TILE_SIZE
+        top = view_top // TILE_SIZE
+        right = -(-(view_left + camera.width) // TILE_SIZE)
+        bottom = -(-(view_top + camera.height) // TILE_SIZE)
+
+        # Decorations of the row below the view can reach up into it
+        if TERRAIN_ATLAS.overhang:
+            bottom += 1
+        return left, top, right, bottom
 
-                # Check if this is the village center
-                if village_center and village_center == (global_x, global_y):
-                    row.append(TerrainType.VILLAGE_CENTER)
+    def draw(self, surface, camera):
+        """Draw visible portion of the map"""
+        chunk_pixels = self.chunk_size * TILE_SIZE
+        left, top, right, bottom = self.get_visible_tile_bounds(camera)
+
+        # Chunks covering the visible tiles, whatever the window and tile size
+        chunk_left = left // self.chunk_size
+        chunk_top = top // self.chunk_size
+        chunk_right = (right - 1) // self.chunk_size
+        chunk_bottom = (bottom - 1) // self.chunk_size
+
+        # Keep every visible chunk surface cached, or they would evict each other
+        visible_chunks = (chunk_right - chunk_left + 1) * (chunk_bottom - chunk_top + 1)
+        self.chunk_surface_cache_size = max(CHUNK_SURFACE_CACHE_SIZE, 2 * visible_chunks)
+
+        overhangs = []
+        for cy in range(chunk_top, chunk_bottom + 1):
+            for cx in range(chunk_left, chunk_right + 1):
+                # Visible tiles of this chunk, in chunk-local tiles
+                local_left = max(left, cx * self.chunk_size) - cx * self.chunk_size
+                local_top = max(top, cy * self.chunk_size) - cy * self.chunk_size
+                local_right = min(right, (cx + 1) * self.chunk_size) - cx * self.chunk_size
+                local_bottom = min(bottom, (cy + 1) * self.chunk_size) - cy * self.chunk_size
+                area = pygame.Rect(local_left * TILE_SIZE, local_top * TILE_SIZE,
+                                   (local_right - local_left) * TILE_SIZE, (local_bottom - local_top) * TILE_SIZE)
+
+                screen_x = cx * chunk_pixels + camera.rect.x
+                screen_y = cy * chunk_pixels + camera.rect.y
+                dest = (screen_x + area.x, screen_y + area.y)
+
+                # Draw a placeholder until the chunk is generated
+                if not self.request_chunk(cx, cy):
+                    pygame.draw.rect(surface, COLORS["placeholder"], pygame.Rect(dest, area.size))
                     continue
 
-                # Check if this is near the village center
-                if village_center:
-                    dist_to_village_sq = (global_x - village_center[0]) ** 2 + (global_y - village_center[1]) ** 2
-
-                    # Houses around village center
-                    if dist_to_village_sq <= 9:  # Within 3 tiles
-                        row.append(TerrainType.HOUSE)
-                        continue
-
-                    # Roads/paths around houses
-                    if dist_to_village_sq <= 25:  # Within 5 tiles
-                        if random.random() < 0.7:  # 70% chance for path
-                            row.append(TerrainType.PATH)
-                            continue
-
-                # Get height and biome
-                height = self.get_height(global_x, global_y)
-                biome = self.determine_biome(global_x, global_y)
-                feature_value = self.get_feature_value(global_x, global_y)
-
-                # Generate terrain based on biome
-                if biome == Biome.OCEAN:
-                    if height < 0.2:
-                        row.append(TerrainType.DEEP_WATER)
-                    else:
-                        row.append(TerrainType.WATER)
-                elif abs(feature_value) > 0.8:  # Special features like rivers or lakes
-                    if height < 0.4:
-                        row.append(TerrainType.WATER)
-                    else:
-                        # Random feature based on biome
-                        terrain_weights = BIOME_TERRAIN_WEIGHTS[biome]
-                        terrain = random.choices(
-                            [terrain for terrain, _ in terrain_weights],
-                            weights=[weight for _, weight in terrain_weights],
-                            k=1
-                        )[0]
-                        row.append(terrain)
-                else:
-                    # Standard biome terrain
-                    terrain_weights = BIOME_TERRAIN_WEIGHTS[biome]
-                    terrain = random.choices(
-                        [terrain for terrain, _ in terrain_weights],
-                        weights=[weight for _, weight in terrain_weights],
-                        k=1
-                    )[0]
-                    row.append(terrain)
-
-            chunk.append(row)
-
-        # Store the generated chunk
-        self.terrain_map[(chunk_x, chunk_y)] = chunk
-        self.generated_chunks.add((chunk_x, chunk_y))
+                chunk_surface, overhang = self.get_chunk_surface(cx, cy)
+                surface.blit(chunk_surface, dest, area)
+                if overhang is not None and local_top == 0:
+                    overhang_area = pygame.Rect(area.x, 0, area.width, overhang.get_height())
+                    overhangs.append((overhang, (dest[0], screen_y - overhang.get_height()), overhang_area))
 
-    def draw(self, surface, camera):
-        """Draw visible portion of the map"""
-        # Determine the chunks that should be visible based on camera position
-        cam_chunk_x = (-camera.rect.x) // (self.chunk_size * TILE_SIZE)
-        cam_chunk_y = (-camera.rect.y) // (self.chunk_size * TILE_SIZE)
-
-        # Draw a 3x3 grid of chunks around the camera
-        for cy in range(cam_chunk_y - 1, cam_chunk_y + 2):
-            for cx in range(cam_chunk_x - 1, cam_chunk_x + 2):
-                # Ensure the chunk is generated
-                if (cx, cy) not in self.terrain_map:
-                    self.generate_chunk(cx, cy)
-
-                # Draw the chunk
-                for local_y in range(self.chunk_size):
-                    for local_x in range(self.chunk_size):
-                        # Calculate global position
-                        global_x = cx * self.chunk_size + local_x
-                        global_y = cy * self.chunk_size + local_y
-
-                        # Calculate screen position
-                        screen_x = global_x * TILE_SIZE + camera.rect.x
-                        screen_y = global_y * TILE_SIZE + camera.rect.y
-
-                        # Skip if off-screen
-                        if (screen_x < -TILE_SIZE or screen_x > SCREEN_WIDTH or
-                                screen_y < -TILE_SIZE or screen_y > SCREEN_HEIGHT):
-                            continue
-
-                        # Get terrain type and color
-                        terrain = self.terrain_map[(cx, cy)][local_y][local_x]
-                        color = COLORS["grass"]  # Default color
-
-                        # Map terrain to color
-                        if terrain == TerrainType.GRASS:
-                            color = COLORS["grass"]
-                        elif terrain == TerrainType.TALL_GRASS:
-                            color = COLORS["tall_grass"]
-                        elif terrain == TerrainType.FOREST:
-                            color = COLORS["forest"]
-                        elif terrain == TerrainType.DEEP_FOREST:
-                            color = COLORS["deep_forest"]
-                        elif terrain == TerrainType.WATER:
-                            color = COLORS["water"]
-                        elif terrain == TerrainType.DEEP_WATER:
-                            color = COLORS["deep_water"]
-                        elif terrain == TerrainType.SAND:
-                            color = COLORS["sand"]
-                        elif terrain == TerrainType.MOUNTAIN:
-                            color = COLORS["mountain"]
-                        elif terrain == TerrainType.SNOW:
-                            color = COLORS["snow"]
-                        elif terrain == TerrainType.DESERT:
-                            color = COLORS["desert"]
-                        elif terrain == TerrainType.STONE:
-                            color = COLORS["stone"]
-                        elif terrain == TerrainType.LAVA:
-                            color = COLORS["lava"]
-                        elif terrain == TerrainType.ROAD:
-                            color = COLORS["road"]
-                        elif terrain == TerrainType.PATH:
-                            color = COLORS["path"]
-                        elif terrain == TerrainType.HOUSE:
-                            color = COLORS["house"]
-                        elif terrain == TerrainType.ROOF:
-                            color = COLORS["roof"]
-                        elif terrain == TerrainType.VILLAGE_CENTER:
-                            color = COLORS["village_center"]
-
-                        # Draw the tile
-                        rect = pygame.Rect(screen_x, screen_y, TILE_SIZE, TILE_SIZE)
-                        pygame.draw.rect(surface, color, rect)
-
-                        # Add details for some terrain types
-                        if terrain == TerrainType.FOREST:
-                            # Draw simple tree trunk
-                            trunk_rect = pygame.Rect(screen_x + TILE_SIZE // 3, screen_y + TILE_SIZE // 2,
-                                                     TILE_SIZE // 3, TILE_SIZE // 2)
-                            pygame.draw.rect(surface, (100, 70, 40), trunk_rect)
-
-                            # Draw simple tree top (circle)
-                            pygame.draw.circle(surface, (45, 120, 45),
-                                               (screen_x + TILE_SIZE // 2, screen_y + TILE_SIZE // 3),
-                                               TILE_SIZE // 2)
-
-                        elif terrain == TerrainType.HOUSE:
-                            # Draw house walls
-                            pygame.draw.rect(surface, COLORS["house"], rect)
-
-                            # Draw house roof
-                            roof_points = [
-                                (screen_x, screen_y),
-                                (screen_x + TILE_SIZE, screen_y),
-                                (screen_x + TILE_SIZE // 2, screen_y - TILE_SIZE // 2)
-                            ]
-                            pygame.draw.polygon(surface, COLORS["roof"], roof_points)
-
-                            # Draw door
-                            door_rect = pygame.Rect(screen_x + TILE_SIZE // 3, screen_y + TILE_SIZE // 2,
-                                                    TILE_SIZE // 3, TILE_SIZE // 2)
-                            pygame.draw.rect(surface, (60, 30, 15), door_rect)
-
-                        elif terrain == TerrainType.VILLAGE_CENTER:
-                            # Draw well or fountain
-                            pygame.draw.circle(surface, COLORS["stone"],
-                                               (screen_x + TILE_SIZE // 2, screen_y + TILE_SIZE // 2),
-                                               TILE_SIZE // 2)
-                            pygame.draw.circle(surface, COLORS["water"],
-                                               (screen_x + TILE_SIZE // 2, screen_y + TILE_SIZE // 2),
-                                               TILE_SIZE // 3)
+        # Roofs and tree tops reaching into the chunk above go on top of it
+        for overhang, position, overhang_area in overhangs:
+            surface.blit(overhang, position, overhang_area)
 
 
 # Player class
@@ -1246,6 +2614,9 @@ class Player(pygame.sprite.Sprite):
         self.moving = False
         self.attacking = False
         self.attack_frame = 0
+        self.frame_sheet = SurfaceCache(PLAYER_FRAME_CACHE_SIZE)  # Frames drawn with the equipped weapon
+        self.sheet_weapon = None  # Weapon type of the frames in frame_sheet
+        self.frame_key = None  # Key of the frame in self.image
 
         # Core stats
         self.base_stats = {
@@ -1345,9 +2716,46 @@ class Player(pygame.sprite.Sprite):
         surface.blit(self.image, (screen_x, screen_y))
 
     def update_appearance(self):
-        """Update player sprite based on current state"""
-        self.image.fill((0, 0, 0, 0))  # Clear with transparency
+        """Update player sprite based on current state
+
+        Frames are drawn once into the animation sheet of the equipped weapon type and
+        reused, so this is only a lookup. The sheet is rebuilt when the weapon changes.
+        """
+        weapon_type = self.equipped["weapon"].weapon_type if self.equipped["weapon"] else None
+        if weapon_type != self.sheet_weapon:
+            self.frame_sheet.clear()
+            self.sheet_weapon = weapon_type
+            self.frame_key = None
+
+        attack_frame = int(self.attack_frame) if self.attacking else None
+        overlays = tuple(effect.get("type", "") for effect in self.status_effects
+                         if effect.get("type", "") in ("poison", "burn", "freeze", "buff"))
+        key = (self.direction, quantize_animation(self.animation_frame), self.moving, attack_frame, overlays)
+
+        if key == self.frame_key:
+            return
+
+        self.frame_key = key
+        self.image = self.frame_sheet.get(key, lambda: self.render_frame(key))
+
+    def render_frame(self, key):
+        """Draw the frame of a key into a new surface"""
+        _, pose, _, attack_frame, _ = key
 
+        saved = self.image, self.animation_frame, self.attack_frame
+        self.image = pygame.Surface((TILE_SIZE, TILE_SIZE), pygame.SRCALPHA)
+        self.animation_frame = pose_animation_frame(pose)
+        self.attack_frame = attack_frame or 0
+
+        try:
+            # Random particles are fixed per key so the cached frame is stable
+            self.draw_frame(random.Random(str(key)))
+            return self.image
+        finally:
+            self.image, self.animation_frame, self.attack_frame = saved
+
+    def draw_frame(self, rng=random):
+        """Draw body, limbs, weapon and status effects into self.image"""
         # Body color
         body_color = COLORS["player"]
 
@@ -1431,7 +2839,7 @@ class Player(pygame.sprite.Sprite):
         self.draw_weapon()
 
         # Draw status effects
-        self.draw_status_effects()
+        self.draw_status_effects(rng)
 
     def draw_limbs(self):
         """Draw arms and legs with animation"""
@@ -2311,7 +3719,7 @@ class Player(pygame.sprite.Sprite):
 
                 self.image.blit(glow_surf, glow_pos)
 
-    def draw_status_effects(self):
+    def draw_status_effects(self, rng=random):
 
         """Draw active status effects around player"""
 
@@ -2347,15 +3755,15 @@ class Player(pygame.sprite.Sprite):
             # Add some particle effects
 
             for _ in range(2):
-                angle = self.animation_frame * 0.2 + random.random() * math.pi * 2
+                angle = self.animation_frame * 0.2 + rng.random() * math.pi * 2
 
-                distance = TILE_SIZE // 3 * (0.8 + random.random() * 0.4)
+                distance = TILE_SIZE // 3 * (0.8 + rng.random() * 0.4)
 
                 x = TILE_SIZE // 2 + math.cos(angle) * distance
 
                 y = TILE_SIZE // 2 + math.sin(angle) * distance
 
-                size = 2 + random.randint(0, 2)
+                size = 2 + rng.randint(0, 2)
 
                 # Draw particle
 
@@ -2717,20 +4125,7 @@ class Player(pygame.sprite.Sprite):
         if not hasattr(self, 'game') or not self.game.enemies:
             return None
 
-        nearest = None
-
-        min_dist = range_tiles * TILE_SIZE
-
-        for enemy in self.game.enemies:
-
-            dist = ((enemy.rect.centerx - self.rect.centerx) ** 2 +
-
-                    (enemy.rect.centery - self.rect.centery) ** 2) ** 0.5
-
-            if dist < min_dist:
-                min_dist = dist
-
-                nearest = enemy
+        nearest = self.game.enemies.get_nearest(self.rect.centerx, self.rect.centery, range_tiles * TILE_SIZE)
 
         return [nearest] if nearest else None
 
@@ -2741,20 +4136,7 @@ class Player(pygame.sprite.Sprite):
         if not hasattr(self, 'game') or not self.game.enemies:
             return []
 
-        targets = []
-
-        max_dist = range_tiles * TILE_SIZE
-
-        for enemy in self.game.enemies:
-
-            dist = ((enemy.rect.centerx - self.rect.centerx) ** 2 +
-
-                    (enemy.rect.centery - self.rect.centery) ** 2) ** 0.5
-
-            if dist <= max_dist:
-                targets.append(enemy)
-
-        return targets
+        return self.game.enemies.get_in_radius(self.rect.centerx, self.rect.centery, range_tiles * TILE_SIZE)
 
     def take_damage(self, amount, is_crit=False):
         """接受伤害并显示浮动文字"""
@@ -2895,10 +4277,8 @@ class Player(pygame.sprite.Sprite):
 
         screen_y = self.rect.top - camera_pos[1]
 
-        font = pygame.font.Font(None, 18)
-
         for text in self.floating_texts:
-            text_surface = font.render(text["text"], True, text["color"])
+            text_surface = render_text(text["text"], text["color"], 18)
 
             text_rect = text_surface.get_rect(center=(screen_x, screen_y + text["y"]))
 
@@ -3240,18 +4620,19 @@ class Monster(pygame.sprite.Sprite):
         self.moving = False
         self.attacking = False
         self.attack_frame = 0
+        self.frame_key = None  # Key of the shared frame in self.image
 
-        # Set name based on type
+        # Name, stats and skills come from the shared archetype of the type
 
-        self.name = self.get_monster_name()
+        self.archetype = MONSTER_ARCHETYPES.get(monster_type, UNKNOWN_MONSTER)
 
-        # Initialize stats based on monster type and level
+        self.name = self.archetype.name
 
-        self.initialize_stats()
+        self.base_stats = self.archetype.get_stats(level)
 
-        # Skills based on monster type
+        self.stats = self.base_stats.copy()
 
-        self.skills = self.get_monster_skills()
+        self.skills = self.archetype.get_skills(level)
 
         # Status effects
 
@@ -3279,397 +4660,163 @@ class Monster(pygame.sprite.Sprite):
 
         self.target = None
 
-        self.path = []
+        self.path = []  # Tiles still to walk to the patrol point, from the game's pathfinder
 
-        self.state = "idle"  # idle, patrol, chase, attack
+        self.path_goal = None  # Tile the path leads to, or is being searched for
 
-        # Update appearance
+        self.move_speed = self.archetype.speed
 
-        self.update_appearance()
+        self.state = "idle"  # idle, patrol, chase, attack
 
-    def get_monster_name(self):
+        # Simulation level of detail
 
-        """Get name based on monster type"""
+        self.pending_dt = 0  # Time not yet simulated while on coarse ticks
 
-        if self.monster_type == MonsterType.SLIME:
+        self.pending_frames = 0  # Frames that time spans
 
-            return "Slime"
+        self.move_frames = 1  # Frames of movement each move in the current tick covers
 
-        elif self.monster_type == MonsterType.WOLF:
+        self.spawn_index = game.next_spawn_index() if game else 0  # Spreads coarse ticks over frames
 
-            return "Wolf"
+        # Game time when the monster went dormant; it is dormant from creation until first updated
 
-        elif self.monster_type == MonsterType.GOBLIN:
+        self.dormant_since = getattr(game, "sim_time", None)
 
-            return "Goblin"
+        # Update appearance
 
-        elif self.monster_type == MonsterType.SKELETON:
+        self.update_appearance()
 
-            return "Skeleton"
+    def draw(self, surface, camera_pos):
+        """Draw monster on surface"""
+        # Get screen position
+        screen_x = self.rect.x - camera_pos[0]
+        screen_y = self.rect.y - camera_pos[1]
 
-        elif self.monster_type == MonsterType.TROLL:
+        # Draw monster sprite
+        surface.blit(self.image, (screen_x, screen_y))
 
-            return "Troll"
+    def get_frame_key(self):
 
-        elif self.monster_type == MonsterType.GHOST:
+        """Get everything the drawn sprite depends on, with the animation quantized to a pose"""
 
-            return "Ghost"
+        attack_frame = int(self.attack_frame) if self.attacking else None
 
-        elif self.monster_type == MonsterType.DRAGON:
+        wing_attack = self.monster_type == MonsterType.DRAGON and self.state == "attack"
 
-            return "Dragon"
+        overlays = tuple(effect.get("type", "") for effect in self.status_effects
+                         if effect.get("type", "") in ("poison", "burn", "freeze", "stun"))
 
-        elif self.monster_type == MonsterType.BANDIT:
+        return (self.monster_type, self.direction, quantize_animation(self.animation_frame),
+                self.moving, attack_frame, wing_attack, overlays)
 
-            return "Bandit"
+    def update_appearance(self):
 
-        else:
+        """Update sprite appearance based on monster type and state
 
-            return "Unknown Monster"
+        Frames are shared by all monsters through MONSTER_FRAMES, so the sprite is only
+        drawn the first time a key is seen, and self.image only changes with the key.
+        """
 
-    def initialize_stats(self):
+        key = self.get_frame_key()
 
-        """Initialize monster stats based on type and level"""
+        if key == self.frame_key:
+            return
 
-        # Base stats for all monsters
+        self.frame_key = key
 
-        self.base_stats = {
+        self.image = MONSTER_FRAMES.get(key, lambda: self.render_frame(key))
 
-            "level": self.level,
+    def render_frame(self, key):
 
-            "hp": 20 + self.level * 5,
+        """Draw the frame of a key into a new surface"""
 
-            "max_hp": 20 + self.level * 5,
+        _, _, pose, _, attack_frame, _, _ = key
 
-            "mp": 10 + self.level * 2,
+        saved = self.image, self.animation_frame, self.attack_frame
 
-            "max_mp": 10 + self.level * 2,
+        self.image = pygame.Surface((TILE_SIZE, TILE_SIZE), pygame.SRCALPHA)
 
-            "attack": 5 + self.level,
+        self.animation_frame = pose_animation_frame(pose)
 
-            "defense": 2 + self.level // 2,
+        self.attack_frame = attack_frame or 0
 
-            "crit": 3,
+        # Random particles are fixed per key so the cached frame is stable
 
-            "agility": 3,
+        rng = random.Random(str(key))
 
-            "exp_value": 10 + self.level * 5,
+        try:
 
-            "attack_range": 1,
+            # Draw based on monster type
 
-            "attack_speed": 1.0
+            if self.monster_type == MonsterType.SLIME:
 
-        }
+                self.draw_slime()
 
-        # Adjust stats based on monster type
+            elif self.monster_type == MonsterType.WOLF:
 
-        if self.monster_type == MonsterType.SLIME:
+                self.draw_wolf()
 
-            self.base_stats.update({
+            elif self.monster_type == MonsterType.GOBLIN:
 
-                "hp": 15 + self.level * 4,
+                self.draw_goblin()
 
-                "max_hp": 15 + self.level * 4,
+            elif self.monster_type == MonsterType.SKELETON:
 
-                "attack": 3 + self.level,
+                self.draw_skeleton()
 
-                "defense": 1 + self.level // 3,
+            elif self.monster_type == MonsterType.TROLL:
 
-                "exp_value": 5 + self.level * 3
+                self.draw_troll()
 
-            })
+            elif self.monster_type == MonsterType.GHOST:
 
-        elif self.monster_type == MonsterType.WOLF:
+                self.draw_ghost(rng)
 
-            self.base_stats.update({
+            elif self.monster_type == MonsterType.DRAGON:
 
-                "hp": 18 + self.level * 4,
+                self.draw_dragon(rng)
 
-                "max_hp": 18 + self.level * 4,
+            elif self.monster_type == MonsterType.BANDIT:
 
-                "attack": 6 + self.level * 1.2,
+                self.draw_bandit()
 
-                "agility": 7 + self.level // 2,
+            # Draw status effects
 
-                "crit": 5,
+            self.draw_status_effects(rng)
 
-                "attack_speed": 1.2
+            return self.image
 
-            })
+        finally:
 
-        elif self.monster_type == MonsterType.GOBLIN:
+            self.image, self.animation_frame, self.attack_frame = saved
 
-            self.base_stats.update({
+    def draw_slime(self):
 
-                "hp": 15 + self.level * 3,
+        """Draw slime monster"""
 
-                "max_hp": 15 + self.level * 3,
+        # Animation bounce
 
-                "attack": 4 + self.level,
+        bounce = math.sin(self.animation_frame * 5) * 2
 
-                "defense": 2 + self.level // 3,
+        # Base slime body - semi-circle
 
-                "agility": 5 + self.level // 2,
+        slime_color = (100, 200, 100)  # Green
 
-                "attack_speed": 1.1
+        radius = TILE_SIZE // 2
 
-            })
+        # Draw main body
 
-        elif self.monster_type == MonsterType.SKELETON:
+        pygame.draw.ellipse(self.image, slime_color,
 
-            self.base_stats.update({
+                            pygame.Rect(0, TILE_SIZE // 4 - bounce // 2,
 
-                "hp": 25 + self.level * 4,
+                                        TILE_SIZE, TILE_SIZE * 3 // 4 + bounce))
 
-                "max_hp": 25 + self.level * 4,
+        # Draw eyes
 
-                "mp": 5 + self.level,
+        eye_y = TILE_SIZE // 2
 
-                "max_mp": 5 + self.level,
-
-                "attack": 5 + self.level,
-
-                "defense": 3 + self.level // 2,
-
-                "agility": 2 + self.level // 3
-
-            })
-
-        elif self.monster_type == MonsterType.TROLL:
-
-            self.base_stats.update({
-
-                "hp": 40 + self.level * 8,
-
-                "max_hp": 40 + self.level * 8,
-
-                "mp": 5 + self.level,
-
-                "max_mp": 5 + self.level,
-
-                "attack": 8 + self.level * 1.5,
-
-                "defense": 5 + self.level,
-
-                "agility": 1 + self.level // 4,
-
-                "attack_speed": 0.7,
-
-                "exp_value": 15 + self.level * 8
-
-            })
-
-        elif self.monster_type == MonsterType.GHOST:
-
-            self.base_stats.update({
-
-                "hp": 20 + self.level * 3,
-
-                "max_hp": 20 + self.level * 3,
-
-                "mp": 20 + self.level * 3,
-
-                "max_mp": 20 + self.level * 3,
-
-                "attack": 3 + self.level * 0.8,
-
-                "defense": 1 + self.level // 3,
-
-                "agility": 4 + self.level // 2,
-
-                "attack_range": 2
-
-            })
-
-        elif self.monster_type == MonsterType.DRAGON:
-
-            self.base_stats.update({
-
-                "hp": 60 + self.level * 10,
-
-                "max_hp": 60 + self.level * 10,
-
-                "mp": 30 + self.level * 5,
-
-                "max_mp": 30 + self.level * 5,
-
-                "attack": 12 + self.level * 2,
-
-                "defense": 8 + self.level,
-
-                "crit": 7,
-
-                "agility": 3 + self.level // 3,
-
-                "attack_range": 3,
-
-                "exp_value": 50 + self.level * 15
-
-            })
-
-        elif self.monster_type == MonsterType.BANDIT:
-
-            self.base_stats.update({
-
-                "hp": 22 + self.level * 4,
-
-                "max_hp": 22 + self.level * 4,
-
-                "mp": 10 + self.level * 2,
-
-                "max_mp": 10 + self.level * 2,
-
-                "attack": 5 + self.level * 1.1,
-
-                "defense": 3 + self.level // 2,
-
-                "crit": 6,
-
-                "agility": 6 + self.level // 2
-
-            })
-
-        # Copy to current stats
-
-        self.stats = self.base_stats.copy()
-
-    def get_monster_skills(self):
-
-        """Get skills based on monster type"""
-
-        skills = []
-
-        # Assign skills based on monster type
-
-        if self.monster_type == MonsterType.SLIME:
-
-            # No special skills for slimes
-
-            pass
-
-        elif self.monster_type == MonsterType.WOLF:
-
-            if self.level >= 3:
-                skills.append(copy.deepcopy(SKILLS[SkillType.CHARGE]))
-
-        elif self.monster_type == MonsterType.GOBLIN:
-
-            if self.level >= 3:
-                skills.append(copy.deepcopy(SKILLS[SkillType.POISON_STRIKE]))
-
-        elif self.monster_type == MonsterType.SKELETON:
-
-            if self.level >= 2:
-                skills.append(copy.deepcopy(SKILLS[SkillType.SLASH]))
-
-        elif self.monster_type == MonsterType.TROLL:
-
-            if self.level >= 2:
-                skills.append(copy.deepcopy(SKILLS[SkillType.SLASH]))
-
-            if self.level >= 5:
-                skills.append(copy.deepcopy(SKILLS[SkillType.WHIRLWIND]))
-
-        elif self.monster_type == MonsterType.GHOST:
-
-            if self.level >= 2:
-                skills.append(copy.deepcopy(SKILLS[SkillType.FROST_NOVA]))
-
-        elif self.monster_type == MonsterType.DRAGON:
-
-            if self.level >= 1:
-                skills.append(copy.deepcopy(SKILLS[SkillType.FIREBALL]))
-
-            if self.level >= 5:
-                skills.append(copy.deepcopy(SKILLS[SkillType.WHIRLWIND]))
-
-        elif self.monster_type == MonsterType.BANDIT:
-
-            if self.level >= 3:
-                skills.append(copy.deepcopy(SKILLS[SkillType.SLASH]))
-
-        return skills
-
-    def draw(self, surface, camera_pos):
-        """Draw monster on surface"""
-        # Get screen position
-        screen_x = self.rect.x - camera_pos[0]
-        screen_y = self.rect.y - camera_pos[1]
-
-        # Draw monster sprite
-        surface.blit(self.image, (screen_x, screen_y))
-
-    def update_appearance(self):
-
-        """Update sprite appearance based on monster type and state"""
-
-        self.image.fill((0, 0, 0, 0))  # Clear with transparency
-
-        # Draw based on monster type
-
-        if self.monster_type == MonsterType.SLIME:
-
-            self.draw_slime()
-
-        elif self.monster_type == MonsterType.WOLF:
-
-            self.draw_wolf()
-
-        elif self.monster_type == MonsterType.GOBLIN:
-
-            self.draw_goblin()
-
-        elif self.monster_type == MonsterType.SKELETON:
-
-            self.draw_skeleton()
-
-        elif self.monster_type == MonsterType.TROLL:
-
-            self.draw_troll()
-
-        elif self.monster_type == MonsterType.GHOST:
-
-            self.draw_ghost()
-
-        elif self.monster_type == MonsterType.DRAGON:
-
-            self.draw_dragon()
-
-        elif self.monster_type == MonsterType.BANDIT:
-
-            self.draw_bandit()
-
-        # Draw status effects
-
-        self.draw_status_effects()
-
-    def draw_slime(self):
-
-        """Draw slime monster"""
-
-        # Animation bounce
-
-        bounce = math.sin(self.animation_frame * 5) * 2
-
-        # Base slime body - semi-circle
-
-        slime_color = (100, 200, 100)  # Green
-
-        radius = TILE_SIZE // 2
-
-        # Draw main body
-
-        pygame.draw.ellipse(self.image, slime_color,
-
-                            pygame.Rect(0, TILE_SIZE // 4 - bounce // 2,
-
-                                        TILE_SIZE, TILE_SIZE * 3 // 4 + bounce))
-
-        # Draw eyes
-
-        eye_y = TILE_SIZE // 2
-
-        eye_spacing = TILE_SIZE // 4
+        eye_spacing = TILE_SIZE // 4
 
         # Left eye
 
@@ -4479,7 +5626,7 @@ class Monster(pygame.sprite.Sprite):
 
                                      leg_width, leg_height - stomp))
 
-    def draw_ghost(self):
+    def draw_ghost(self, rng=random):
 
         """Draw ghost monster"""
 
@@ -4619,11 +5766,11 @@ class Monster(pygame.sprite.Sprite):
         # Ghostly particle effects
 
         for _ in range(3):
-            particle_x = random.randint(body_rect.left, body_rect.right)
+            particle_x = rng.randint(body_rect.left, body_rect.right)
 
-            particle_y = random.randint(body_rect.top, body_rect.bottom + wave_height)
+            particle_y = rng.randint(body_rect.top, body_rect.bottom + wave_height)
 
-            particle_radius = random.randint(1, 3)
+            particle_radius = rng.randint(1, 3)
 
             pygame.draw.circle(ghost_surface, (255, 255, 255, 100),
 
@@ -4633,7 +5780,7 @@ class Monster(pygame.sprite.Sprite):
 
         self.image.blit(ghost_surface, (0, 0))
 
-    def draw_dragon(self):
+    def draw_dragon(self, rng=random):
 
         """Draw dragon monster"""
 
@@ -4787,11 +5934,11 @@ class Monster(pygame.sprite.Sprite):
             # Draw multiple fire particles
 
             for _ in range(8):
-                angle_offset = random.uniform(-0.3, 0.3)
+                angle_offset = rng.uniform(-0.3, 0.3)
 
-                length_offset = random.uniform(0.5, 1.0)
+                length_offset = rng.uniform(0.5, 1.0)
 
-                width = random.randint(2, 4)
+                width = rng.randint(2, 4)
 
                 angle = 0 if head_direction > 0 else math.pi
 
@@ -4805,7 +5952,7 @@ class Monster(pygame.sprite.Sprite):
 
                 colors = [(255, 50, 0), (255, 150, 0), (255, 200, 50)]
 
-                color = random.choice(colors)
+                color = rng.choice(colors)
 
                 pygame.draw.line(self.image, color,
 
@@ -4993,7 +6140,7 @@ class Monster(pygame.sprite.Sprite):
 
                          (body_rect.right - TILE_SIZE // 12, leg_y + leg_length - walk_offset), 2)
 
-    def draw_status_effects(self):
+    def draw_status_effects(self, rng=random):
 
         """Draw status effects around monster"""
 
@@ -5029,15 +6176,15 @@ class Monster(pygame.sprite.Sprite):
             # Add particle effects
 
             for _ in range(2):
-                angle = self.animation_frame * 0.2 + random.random() * math.pi * 2
+                angle = self.animation_frame * 0.2 + rng.random() * math.pi * 2
 
-                distance = TILE_SIZE // 3 * (0.8 + random.random() * 0.4)
+                distance = TILE_SIZE // 3 * (0.8 + rng.random() * 0.4)
 
                 x = TILE_SIZE // 2 + math.cos(angle) * distance
 
                 y = TILE_SIZE // 2 + math.sin(angle) * distance
 
-                size = 2 + random.randint(0, 2)
+                size = 2 + rng.randint(0, 2)
 
                 # Draw particle
 
@@ -5047,6 +6194,22 @@ class Monster(pygame.sprite.Sprite):
 
         """Update monster state"""
 
+        self.simulate(dt, player, game_map)
+
+        # Update appearance
+
+        self.update_appearance()
+
+    def simulate(self, dt, player, game_map, frames=1):
+
+        """Advance timers, status effects and AI without redrawing
+
+        Movement goes a fixed distance per frame, so when dt spans several frames
+        (a coarse tick) each move of the AI is taken once per frame.
+        """
+
+        self.move_frames = frames
+
         # Update animation frame
 
         self.animation_frame += dt * 10
@@ -5062,6 +6225,8 @@ class Monster(pygame.sprite.Sprite):
         if self.wander_cooldown > 0:
             self.wander_cooldown -= dt
 
+        self.update_skill_cooldowns(dt)
+
         # Update status effects
 
         self.update_status_effects(dt)
@@ -5087,9 +6252,45 @@ class Monster(pygame.sprite.Sprite):
         if not self.is_stunned():
             self.update_ai(player, game_map)
 
-        # Update appearance
+    def fast_forward(self, elapsed):
 
-        self.update_appearance()
+        """Catch up timers and status effects for time spent dormant"""
+
+        self.animation_frame += elapsed * 10
+
+        self.attack_cooldown -= elapsed
+
+        self.skill_cooldown -= elapsed
+
+        self.wander_cooldown -= elapsed
+
+        self.update_skill_cooldowns(elapsed)
+
+        self.attacking = False
+
+        self.attack_frame = 0
+
+        # Step status effects so poison and burn ticks land as they would have
+
+        remaining = elapsed
+
+        while remaining > 0 and self.status_effects and self.alive():
+            step = min(FAST_FORWARD_STEP, remaining)
+
+            self.update_status_effects(step)
+
+            remaining -= step
+
+        self.update_floating_texts(elapsed)
+
+    def update_skill_cooldowns(self, dt):
+
+        """Count skill cooldowns down by dt seconds"""
+
+        for skill in self.skills:
+
+            if skill.current_cooldown > 0:
+                skill.current_cooldown = max(0, skill.current_cooldown - dt)
 
     def update_status_effects(self, dt):
 
@@ -5232,6 +6433,8 @@ class Monster(pygame.sprite.Sprite):
 
                 self.wander_cooldown = random.uniform(1.0, 3.0)
 
+                self.request_patrol_path()
+
         else:
 
             self.state = "idle"
@@ -5271,7 +6474,7 @@ class Monster(pygame.sprite.Sprite):
 
             # Move toward player
 
-            self.move_toward(player.rect.center, game_map)
+            self.chase(player, game_map)
 
 
 
@@ -5280,7 +6483,7 @@ class Monster(pygame.sprite.Sprite):
             # Move toward patrol point
 
             if self.patrol_point:
-                self.move_toward(self.patrol_point, game_map)
+                self.patrol(game_map)
 
     def face_target(self, target_pos):
 
@@ -5298,13 +6501,100 @@ class Monster(pygame.sprite.Sprite):
 
             self.direction = "down" if dy > 0 else "up"
 
+    def request_patrol_path(self):
+
+        """Ask the game's pathfinder for a path to the patrol point"""
+
+        self.path = []
+
+        if not self.game:
+            self.path_goal = None
+
+            return
+
+        start = (self.rect.centerx // TILE_SIZE, self.rect.centery // TILE_SIZE)
+
+        goal = (int(self.patrol_point[0] // TILE_SIZE), int(self.patrol_point[1] // TILE_SIZE))
+
+        self.path = self.game.pathfinder.request(self, start, goal) or []
+
+    def patrol(self, game_map):
+
+        """Walk the path to the patrol point one tile at a time"""
+
+        tile = (self.rect.centerx // TILE_SIZE, self.rect.centery // TILE_SIZE)
+
+        # Drop the tiles already reached
+
+        while self.path and self.path[0] == tile:
+            self.path.pop(0)
+
+        if self.path:
+
+            next_x, next_y = self.path[0]
+
+            self.move_toward(((next_x + 0.5) * TILE_SIZE, (next_y + 0.5) * TILE_SIZE), game_map)
+
+        elif self.path_goal is None or self.path_goal == tile:
+
+            # No path known or inside the goal tile, head straight for the point
+
+            self.move_toward(self.patrol_point, game_map)
+
+        else:
+
+            # Waiting for the search
+
+            self.moving = False
+
+    def chase(self, player, game_map):
+
+        """Move toward the player along the game's flow field, around water and mountains"""
+
+        flow_field = self.game.flow_field if self.game else None
+
+        next_tile = None
+
+        if flow_field:
+            tile_x = self.rect.centerx // TILE_SIZE
+
+            tile_y = self.rect.centery // TILE_SIZE
+
+            next_tile = flow_field.get_next_tile(tile_x, tile_y)
+
+        if next_tile:
+
+            self.move_toward(((next_tile[0] + 0.5) * TILE_SIZE, (next_tile[1] + 0.5) * TILE_SIZE), game_map)
+
+        else:
+
+            # Off the field or unreachable, head straight for the player
+
+            self.move_toward(player.rect.center, game_map)
+
     def move_toward(self, target_pos, game_map):
 
-        """Move toward target position with pathfinding"""
+        """Move toward target position, stopping where terrain blocks each axis
+
+        While the game is collecting a movement batch a single-frame move is only
+        recorded and carried out with all the others by MonsterMovementBatch.step.
+        """
+
+        batch = self.game.movement_batch if self.game else None
+
+        if batch is not None and batch.collecting and self.move_frames == 1:
+            batch.add(self, target_pos)
+
+            return
+
+        # Coarse ticks take the steps of all the frames they cover
+
+        for _ in range(self.move_frames):
+            self.step_toward(target_pos, game_map)
 
-        # Simple direct movement for now
+    def step_toward(self, target_pos, game_map):
 
-        # A* pathfinding would be better but more complex
+        """Take one frame's step toward target position"""
 
         # Calculate direction
 
@@ -5335,23 +6625,7 @@ class Monster(pygame.sprite.Sprite):
 
         # Calculate movement speed based on monster type
 
-        speed = 1.0  # Default speed
-
-        if self.monster_type == MonsterType.WOLF:
-
-            speed = 1.5
-
-        elif self.monster_type == MonsterType.GOBLIN:
-
-            speed = 1.2
-
-        elif self.monster_type == MonsterType.TROLL:
-
-            speed = 0.7
-
-        elif self.monster_type == MonsterType.GHOST:
-
-            speed = 1.3
+        speed = self.move_speed
 
         # Calculate new position
 
@@ -5359,20 +6633,20 @@ class Monster(pygame.sprite.Sprite):
 
         new_y = self.rect.y + dy * speed * PLAYER_SPEED * 0.8
 
-        # Check collision in X direction
+        # Check collision in X direction, at the tile under the sprite center like the flow field
 
-        tile_x = int(new_x / TILE_SIZE)
+        tile_x = int(new_x + self.rect.width // 2) // TILE_SIZE
 
-        tile_y = int(self.rect.y / TILE_SIZE)
+        tile_y = self.rect.centery // TILE_SIZE
 
         if game_map.is_passable(tile_x, tile_y):
             self.rect.x = new_x
 
         # Check collision in Y direction
 
-        tile_x = int(self.rect.x / TILE_SIZE)
+        tile_x = self.rect.centerx // TILE_SIZE
 
-        tile_y = int(new_y / TILE_SIZE)
+        tile_y = int(new_y + self.rect.height // 2) // TILE_SIZE
 
         if game_map.is_passable(tile_x, tile_y):
             self.rect.y = new_y
@@ -5390,21 +6664,7 @@ class Monster(pygame.sprite.Sprite):
 
         # Set attack cooldown based on monster type
 
-        base_cooldown = 1.0
-
-        if self.monster_type == MonsterType.WOLF:
-
-            base_cooldown = 0.8
-
-        elif self.monster_type == MonsterType.TROLL:
-
-            base_cooldown = 1.5
-
-        elif self.monster_type == MonsterType.DRAGON:
-
-            base_cooldown = 1.2
-
-        self.attack_cooldown = base_cooldown
+        self.attack_cooldown = self.archetype.attack_cooldown
 
         # Calculate damage
 
@@ -5423,33 +6683,16 @@ class Monster(pygame.sprite.Sprite):
 
         target.take_damage(damage, is_crit)
 
-        # Apply special effects based on monster type
-
-        if self.monster_type == MonsterType.WOLF and random.random() < 0.2:
-
-            # Wolves can cause bleeding
-
-            bleed_damage = max(1, self.stats["attack"] // 10)
-
-            target.add_status_effect("bleed", 3, bleed_damage)
-
+        # Apply special effects based on monster type (wolves bleed, ghosts fear, dragons burn)
 
+        hit_effect = self.archetype.hit_effect
 
-        elif self.monster_type == MonsterType.GHOST and random.random() < 0.15:
+        if hit_effect is not None:
 
-            # Ghosts can cause fear (reduces defense)
+            status, chance, duration, stat, divisor = hit_effect
 
-            target.add_status_effect("fear", 4, self.stats["level"])
-
-
-
-        elif self.monster_type == MonsterType.DRAGON and random.random() < 0.3:
-
-            # Dragons can cause burn
-
-            burn_damage = max(1, self.stats["attack"] // 5)
-
-            target.add_status_effect("burn", 3, burn_damage)
+            if random.random() < chance:
+                target.add_status_effect(status, duration, max(1, self.stats[stat] // divisor))
 
         return True
 
@@ -5464,7 +6707,10 @@ class Monster(pygame.sprite.Sprite):
 
         self.attack_frame = 0
 
-        # Use the skill
+        # Use the skill, area skills take a list of targets
+
+        if skill.target_type == "aoe":
+            target = [target]
 
         result = skill.use(self, target)
 
@@ -5572,10 +6818,8 @@ class Monster(pygame.sprite.Sprite):
 
         screen_y = self.rect.top - camera_pos[1]
 
-        font = pygame.font.Font(None, 18)
-
         for text in self.floating_texts:
-            text_surface = font.render(text["text"], True, text["color"])
+            text_surface = render_text(text["text"], text["color"], 18)
 
             text_rect = text_surface.get_rect(center=(screen_x, screen_y + text["y"]))
 
@@ -5615,7 +6859,7 @@ class NPC(pygame.sprite.Sprite):
 
         # Interaction
 
-        self.interaction_radius = TILE_SIZE * 2
+        self.interaction_radius = NPC_INTERACTION_RADIUS
 
         self.dialogue = self.get_random_dialogue()
 
@@ -5865,49 +7109,69 @@ class NPC(pygame.sprite.Sprite):
 
     def update_appearance(self):
 
-        """Update sprite appearance based on biome and state"""
+        """Update sprite appearance based on biome and state
+
+        Frames are shared by all NPCs through NPC_FRAMES and looked up by biome,
+        direction and the animated features, so most frames are only a lookup.
+        """
+
+        # Animation bobbing, in whole pixels
+
+        bob = round(math.sin(self.animation_frame * 3) * 2)
+
+        talk_frame = (int(self.animation_frame * 10) % 3) if self.talking else None
+
+        show_indicator = math.sin(self.animation_frame * 2) > 0.7
+
+        key = (self.biome, self.direction, bob, talk_frame, show_indicator)
+
+        self.image = NPC_FRAMES.get(key, lambda: self.render_frame(*key))
 
-        self.image.fill((0, 0, 0, 0))  # Clear with transparency
+    def render_frame(self, biome, direction, bob, talk_frame, show_indicator):
+
+        """Draw an NPC frame into a new surface"""
+
+        image = pygame.Surface((TILE_SIZE, TILE_SIZE), pygame.SRCALPHA)
 
         # Base colors based on biome
 
-        if self.biome == Biome.PLAINS:
+        if biome == Biome.PLAINS:
 
             body_color = (180, 140, 100)  # Light brown
 
             clothes_color = (100, 180, 100)  # Green
 
-        elif self.biome == Biome.FOREST:
+        elif biome == Biome.FOREST:
 
             body_color = (180, 140, 100)
 
             clothes_color = (40, 120, 40)  # Dark green
 
-        elif self.biome == Biome.MOUNTAINS:
+        elif biome == Biome.MOUNTAINS:
 
             body_color = (200, 160, 120)
 
             clothes_color = (150, 150, 150)  # Gray
 
-        elif self.biome == Biome.DESERT:
+        elif biome == Biome.DESERT:
 
             body_color = (220, 180, 140)  # Tan
 
             clothes_color = (220, 180, 60)  # Yellow
 
-        elif self.biome == Biome.SWAMP:
+        elif biome == Biome.SWAMP:
 
             body_color = (180, 140, 100)
 
             clothes_color = (80, 100, 60)  # Olive
 
-        elif self.biome == Biome.TUNDRA:
+        elif biome == Biome.TUNDRA:
 
             body_color = (200, 160, 120)
 
             clothes_color = (220, 220, 240)  # White/blue
 
-        elif self.biome == Biome.VOLCANIC:
+        elif biome == Biome.VOLCANIC:
 
             body_color = (180, 140, 100)
 
@@ -5919,15 +7183,11 @@ class NPC(pygame.sprite.Sprite):
 
             clothes_color = (100, 100, 180)  # Blue
 
-        # Animation bobbing
-
-        bob = math.sin(self.animation_frame * 3) * 2
-
         # Draw body
 
         body_rect = pygame.Rect(TILE_SIZE // 3, TILE_SIZE // 3 + bob, TILE_SIZE // 3, TILE_SIZE // 3)
 
-        pygame.draw.rect(self.image, body_color, body_rect)
+        pygame.draw.rect(image, body_color, body_rect)
 
         # Draw head
 
@@ -5937,21 +7197,21 @@ class NPC(pygame.sprite.Sprite):
 
         head_radius = TILE_SIZE // 6
 
-        pygame.draw.circle(self.image, body_color, (head_x, head_y), head_radius)
+        pygame.draw.circle(image, body_color, (head_x, head_y), head_radius)
 
         # Draw hat/feature based on biome
 
-        if self.biome == Biome.PLAINS:
+        if biome == Biome.PLAINS:
 
             # Straw hat
 
-            pygame.draw.ellipse(self.image, (220, 200, 100),
+            pygame.draw.ellipse(image, (220, 200, 100),
 
                                 pygame.Rect(head_x - head_radius - 2, head_y - head_radius // 2,
 
                                             head_radius * 2 + 4, head_radius))
 
-        elif self.biome == Biome.FOREST:
+        elif biome == Biome.FOREST:
 
             # Hood
 
@@ -5959,33 +7219,33 @@ class NPC(pygame.sprite.Sprite):
 
                                     head_radius * 2, head_radius + 2)
 
-            pygame.draw.ellipse(self.image, clothes_color, hood_rect)
+            pygame.draw.ellipse(image, clothes_color, hood_rect)
 
-        elif self.biome == Biome.MOUNTAINS:
+        elif biome == Biome.MOUNTAINS:
 
             # Helmet
 
-            pygame.draw.rect(self.image, (150, 150, 150),
+            pygame.draw.rect(image, (150, 150, 150),
 
                              pygame.Rect(head_x - head_radius, head_y - head_radius,
 
                                          head_radius * 2, head_radius))
 
-        elif self.biome == Biome.DESERT:
+        elif biome == Biome.DESERT:
 
             # Desert wrap
 
-            pygame.draw.rect(self.image, clothes_color,
+            pygame.draw.rect(image, clothes_color,
 
                              pygame.Rect(head_x - head_radius, head_y - head_radius,
 
                                          head_radius * 2, head_radius // 2))
 
-        elif self.biome == Biome.VOLCANIC:
+        elif biome == Biome.VOLCANIC:
 
             # Blacksmith mask
 
-            pygame.draw.rect(self.image, (80, 80, 80),
+            pygame.draw.rect(image, (80, 80, 80),
 
                              pygame.Rect(head_x - head_radius // 2, head_y - head_radius // 4,
 
@@ -5999,11 +7259,11 @@ class NPC(pygame.sprite.Sprite):
 
         # Direction-based eyes
 
-        if self.direction == "right":
+        if direction == "right":
 
             eye_offset = 1
 
-        elif self.direction == "left":
+        elif direction == "left":
 
             eye_offset = -1
 
@@ -6013,21 +7273,21 @@ class NPC(pygame.sprite.Sprite):
 
         # Draw eyes
 
-        pygame.draw.circle(self.image, (255, 255, 255),
+        pygame.draw.circle(image, (255, 255, 255),
 
                            (head_x - eye_spacing + eye_offset, eye_y), 2)
 
-        pygame.draw.circle(self.image, (255, 255, 255),
+        pygame.draw.circle(image, (255, 255, 255),
 
                            (head_x + eye_spacing + eye_offset, eye_y), 2)
 
         # Draw pupils
 
-        pygame.draw.circle(self.image, (0, 0, 0),
+        pygame.draw.circle(image, (0, 0, 0),
 
                            (head_x - eye_spacing + eye_offset * 2, eye_y), 1)
 
-        pygame.draw.circle(self.image, (0, 0, 0),
+        pygame.draw.circle(image, (0, 0, 0),
 
                            (head_x + eye_spacing + eye_offset * 2, eye_y), 1)
 
@@ -6035,15 +7295,13 @@ class NPC(pygame.sprite.Sprite):
 
         mouth_y = head_y + head_radius // 2
 
-        if self.talking:
+        if talk_frame is not None:
 
             # Open talking mouth
 
-            talk_frame = (int(self.animation_frame * 10) % 3)
-
             mouth_height = 2 + talk_frame
 
-            pygame.draw.ellipse(self.image, (0, 0, 0),
+            pygame.draw.ellipse(image, (0, 0, 0),
 
                                 pygame.Rect(head_x - 3, mouth_y - mouth_height // 2,
 
@@ -6053,7 +7311,7 @@ class NPC(pygame.sprite.Sprite):
 
             # Closed mouth - smile
 
-            pygame.draw.arc(self.image, (0, 0, 0),
+            pygame.draw.arc(image, (0, 0, 0),
 
                             pygame.Rect(head_x - 5, mouth_y - 3, 10, 6),
 
@@ -6061,7 +7319,7 @@ class NPC(pygame.sprite.Sprite):
 
         # Draw clothes
 
-        pygame.draw.rect(self.image, clothes_color,
+        pygame.draw.rect(image, clothes_color,
 
                          pygame.Rect(body_rect.x - 2, body_rect.y - 2,
 
@@ -6073,13 +7331,13 @@ class NPC(pygame.sprite.Sprite):
 
         arm_y = body_rect.centery
 
-        pygame.draw.line(self.image, body_color,
+        pygame.draw.line(image, body_color,
 
                          (body_rect.x, arm_y),
 
                          (body_rect.x - TILE_SIZE // 8, arm_y), 2)
 
-        pygame.draw.line(self.image, body_color,
+        pygame.draw.line(image, body_color,
 
                          (body_rect.right, arm_y),
 
@@ -6093,13 +7351,13 @@ class NPC(pygame.sprite.Sprite):
 
         bag_size = TILE_SIZE // 5
 
-        pygame.draw.rect(self.image, (139, 69, 19),
+        pygame.draw.rect(image, (139, 69, 19),
 
                          pygame.Rect(bag_x - bag_size // 2, bag_y, bag_size, bag_size))
 
         # Draw tie string
 
-        pygame.draw.line(self.image, (90, 40, 10),
+        pygame.draw.line(image, (90, 40, 10),
 
                          (bag_x - bag_size // 2, bag_y + bag_size // 4),
 
@@ -6107,17 +7365,19 @@ class NPC(pygame.sprite.Sprite):
 
         # Draw interaction indicator if at right time in animation
 
-        if math.sin(self.animation_frame * 2) > 0.7:
+        if show_indicator:
             # Floating exclamation mark
 
-            pygame.draw.rect(self.image, (255, 255, 255),
+            pygame.draw.rect(image, (255, 255, 255),
 
                              pygame.Rect(head_x - 1, head_y - head_radius * 2, 2, 6))
 
-            pygame.draw.circle(self.image, (255, 255, 255),
+            pygame.draw.circle(image, (255, 255, 255),
 
                                (head_x, head_y - head_radius * 2 + 8), 1)
 
+        return image
+
     def update(self, dt, player=None):
 
         """Update NPC state"""
@@ -6206,40 +7466,13 @@ class NPC(pygame.sprite.Sprite):
 
         # Setup text
 
-        font = pygame.font.Font(None, 18)
+        font = get_text_font(self.dialogue, 18)
 
         max_width = TILE_SIZE * 5
 
-        # Split text into words
-
-        words = self.dialogue.split()
-
-        lines = []
-
-        current_line = ""
-
         # Word wrap
 
-        for word in words:
-
-            test_line = current_line + word + " "
-
-            text_width, _ = font.size(test_line)
-
-            if text_width < max_width:
-
-                current_line = test_line
-
-            else:
-
-                lines.append(current_line)
-
-                current_line = word + " "
-
-        # Add the last line
-
-        if current_line:
-            lines.append(current_line)
+        lines = layout_text(self.dialogue, 18, max_width)
 
         # Calculate bubble size
 
@@ -6272,7 +7505,7 @@ class NPC(pygame.sprite.Sprite):
         # Draw text
 
         for i, line in enumerate(lines):
-            text_surface = font.render(line, True, (0, 0, 0))
+            text_surface = render_text(line, (0, 0, 0), 18)
 
             text_x = bubble_x + 5
 
@@ -6319,41 +7552,90 @@ class Item(pygame.sprite.Sprite):
 
         # Pickup range
 
-        self.pickup_radius = TILE_SIZE * 0.8
+        self.pickup_radius = ITEM_PICKUP_RADIUS
 
         # Update appearance
 
         self.update_appearance()
 
+    def get_rarity_tier(self):
+
+        """Get the rarity tier of the item from its value (0 common to 3 epic)"""
+
+        value = getattr(self.equipment, 'value', 0)
+
+        if value > 100:  # Epic
+
+            return 3
+
+        elif value > 50:  # Rare
+
+            return 2
+
+        elif value > 25:  # Uncommon
+
+            return 1
+
+        return 0
+
     def update_appearance(self):
 
-        """Update sprite appearance based on item type"""
+        """Update sprite appearance based on item type
 
-        self.image.fill((0, 0, 0, 0))  # Clear with transparency
+        Frames are shared by all dropped items through ITEM_FRAMES. Each kind of item
+        has GLOW_FRAMES frames for the pulsing glow, indexed by the animation cycle.
+        """
 
-        if self.equipment.type == ItemType.WEAPON:
+        equipment = self.equipment
 
-            self.draw_weapon()
+        potion_effects = tuple(sorted(equipment.stats)) if equipment.type == ItemType.POTION else None
 
-        elif self.equipment.type == ItemType.ARMOR:
+        glow_frame = int(self.animation_frame % (2 * math.pi) / (2 * math.pi) * GLOW_FRAMES) % GLOW_FRAMES
 
-            self.draw_armor()
+        key = (equipment.type, equipment.weapon_type, equipment.armor_type, potion_effects,
+               self.get_rarity_tier(), glow_frame)
 
-        elif self.equipment.type == ItemType.POTION:
+        self.image = ITEM_FRAMES.get(key, lambda: self.render_frame(glow_frame))
 
-            self.draw_potion()
+    def render_frame(self, glow_frame):
 
-        elif self.equipment.type == ItemType.MATERIAL:
+        """Draw the item with one frame of the glow cycle into a new surface"""
 
-            self.draw_material()
+        saved = self.image
 
-        else:
+        self.image = pygame.Surface((TILE_SIZE // 2, TILE_SIZE // 2), pygame.SRCALPHA)
+
+        try:
+
+            if self.equipment.type == ItemType.WEAPON:
+
+                self.draw_weapon()
+
+            elif self.equipment.type == ItemType.ARMOR:
+
+                self.draw_armor()
+
+            elif self.equipment.type == ItemType.POTION:
+
+                self.draw_potion()
+
+            elif self.equipment.type == ItemType.MATERIAL:
+
+                self.draw_material()
+
+            else:
+
+                self.draw_generic_item()
 
-            self.draw_generic_item()
+            # Add glow effect
 
-        # Add glow effect
+            self.add_glow_effect(0.5 + 0.5 * math.sin(glow_frame * 2 * math.pi / GLOW_FRAMES))
 
-        self.add_glow_effect()
+            return self.image
+
+        finally:
+
+            self.image = saved
 
     def draw_weapon(self):
 
@@ -6706,41 +7988,19 @@ class Item(pygame.sprite.Sprite):
 
                          pygame.Rect(2, 2, self.image.get_width() - 4, self.image.get_height() - 4))
 
-    def add_glow_effect(self):
+    def add_glow_effect(self, pulse=1.0):
 
-        """Add pulsing glow effect to item"""
+        """Add pulsing glow effect to item, with pulse from 0 (faintest) to 1 (brightest)"""
 
         # Create a glow/outline based on value/rarity
 
-        glow_color = (255, 255, 100)  # Default yellow
-
-        glow_radius = 1
-
-        # Determine rarity based on value
-
-        if hasattr(self.equipment, 'value'):
-
-            if self.equipment.value > 100:  # Epic
-
-                glow_color = (255, 50, 255)  # Purple
-
-                glow_radius = 2
-
-            elif self.equipment.value > 50:  # Rare
-
-                glow_color = (30, 100, 255)  # Blue
-
-                glow_radius = 2
-
-            elif self.equipment.value > 25:  # Uncommon
-
-                glow_color = (30, 255, 30)  # Green
-
-                glow_radius = 1
+        glow_color, glow_radius = RARITY_GLOW[self.get_rarity_tier()]
 
         # Draw subtle glow
 
-        pygame.draw.rect(self.image, glow_color,
+        alpha = int(255 * (0.5 + 0.5 * pulse))
+
+        pygame.draw.rect(self.image, glow_color + (alpha,),
 
                          pygame.Rect(0, 0, self.image.get_width(), self.image.get_height()),
 
@@ -6760,10 +8020,9 @@ class Item(pygame.sprite.Sprite):
 
         self.rect.y += bob_offset * dt
 
-        # Occasionally update appearance for pulsing effect
+        # Update appearance for pulsing effect
 
-        if random.random() < 0.05:
-            self.update_appearance()
+        self.update_appearance()
 
     def draw(self, surface, camera_pos):
 
@@ -6780,9 +8039,60 @@ class Item(pygame.sprite.Sprite):
         surface.blit(self.image, (screen_x, screen_y))
 
 
+# Base class of the retained-mode UI elements
+
+def opaque(color):
+
+    """Drop the alpha of a color, which drawing on the screen ignores"""
+
+    return tuple(color)[:3]
+
+
+class UIElement:
+
+    """UI element that keeps its rendered look in a cached Surface
+
+    Subclasses draw themselves in render(surface, rect), where rect is the element
+    rect moved to the cache origin, and call mark_dirty() when anything render
+    depends on changes. Until then draw() is a single blit.
+
+    The cache has per-pixel alpha so that the corners and gaps an element leaves
+    unpainted stay see-through. Drawing into it keeps the alpha of a color, unlike
+    drawing on the screen, so render draws with opaque() colors.
+    """
+
+    def mark_dirty(self):
+
+        """Re-render the element the next time it is drawn"""
+
+        self.dirty = True
+
+    def draw(self, surface):
+
+        """Draw element on surface"""
+
+        if not self.visible:
+            return
+
+        if self.dirty or self.cache is None or self.cache.get_size() != self.rect.size:
+            self.cache = pygame.Surface(self.rect.size, pygame.SRCALPHA)
+
+            self.render(self.cache, self.cache.get_rect())
+
+            self.dirty = False
+
+        surface.blit(self.cache, self.rect)
+
+    def render(self, surface, rect):
+
+        """Draw the element into rect of surface"""
+
+        pass
+
+
 # UI Button class
 
-class UIButton:
+class UIButton(UIElement):
 
     def __init__(self, rect, text, callback=None, bg_color=COLORS["ui_button"],
 
@@ -6814,16 +8124,17 @@ class UIButton:
 
         self.enabled = True
 
-        # Create font
+        self.dirty = True
 
-        self.font = pygame.font.Font(None, 24)
+        self.cache = None
 
-    def draw(self, surface):
+        # Create font
 
-        """Draw button on surface"""
+        self.font = get_font(24)
 
-        if not self.visible:
-            return
+    def render(self, surface, rect):
+
+        """Draw button into rect of surface"""
 
         # Determine button color
 
@@ -6836,11 +8147,11 @@ class UIButton:
 
         # Draw button background
 
-        pygame.draw.rect(surface, color, self.rect, border_radius=self.border_radius)
+        pygame.draw.rect(surface, opaque(color), rect, border_radius=self.border_radius)
 
         # Draw border
 
-        pygame.draw.rect(surface, COLORS["ui_border"], self.rect,
+        pygame.draw.rect(surface, COLORS["ui_border"], rect,
 
                          self.border_width, border_radius=self.border_radius)
 
@@ -6848,7 +8159,7 @@ class UIButton:
 
         text_surface = self.font.render(self.text, True, self.text_color)
 
-        text_rect = text_surface.get_rect(center=self.rect.center)
+        text_rect = text_surface.get_rect(center=rect.center)
 
         surface.blit(text_surface, text_rect)
 
@@ -6863,7 +8174,12 @@ class UIButton:
 
             # Check hover state
 
-            self.hovered = self.rect.collidepoint(event.pos)
+            hovered = self.rect.collidepoint(event.pos)
+
+            if hovered != self.hovered:
+                self.hovered = hovered
+
+                self.mark_dirty()
 
 
 
@@ -6894,7 +8210,7 @@ class UIButton:
 
 # UI Panel class
 
-class UIPanel:
+class UIPanel(UIElement):
 
     def __init__(self, rect, bg_color=COLORS["ui_panel"], border_color=COLORS["ui_border"],
 
@@ -6914,6 +8230,10 @@ class UIPanel:
 
         self.children = []  # UI elements contained in this panel
 
+        self.dirty = True
+
+        self.cache = None
+
     def add_child(self, child):
 
         """Add a UI element to this panel"""
@@ -6929,20 +8249,26 @@ class UIPanel:
 
         # Draw panel background
 
-        pygame.draw.rect(surface, self.bg_color, self.rect, border_radius=self.border_radius)
+        super().draw(surface)
+
+        # Draw all children
+
+        for child in self.children:
+            child.draw(surface)
+
+    def render(self, surface, rect):
+
+        """Draw panel background and border into rect of surface"""
+
+        pygame.draw.rect(surface, opaque(self.bg_color), rect, border_radius=self.border_radius)
 
         # Draw border
 
         if self.border_width > 0:
-            pygame.draw.rect(surface, self.border_color, self.rect,
+            pygame.draw.rect(surface, opaque(self.border_color), rect,
 
                              self.border_width, border_radius=self.border_radius)
 
-        # Draw all children
-
-        for child in self.children:
-            child.draw(surface)
-
     def handle_event(self, event):
 
         """Pass events to children"""
@@ -6969,7 +8295,7 @@ class UIPanel:
 
 # UI Text class
 
-class UIText:
+class UIText(UIElement):
 
     def __init__(self, rect, text, font_size=20, color=COLORS["ui_text"],
 
@@ -6991,9 +8317,11 @@ class UIText:
 
         self.visible = True
 
-        # Create font and wrap text
+        self.dirty = True
 
-        self.font = pygame.font.Font(None, font_size)
+        self.cache = None
+
+        # Wrap text, which also picks its font
 
         self.wrap_text()
 
@@ -7001,45 +8329,9 @@ class UIText:
 
         """Wrap text to fit within rect width"""
 
-        self.lines = []
-
-        # Split text into paragraphs
-
-        paragraphs = self.text.split('\n')
-
-        for paragraph in paragraphs:
+        self.font = get_text_font(self.text, self.font_size)
 
-            words = paragraph.split(' ')
-
-            current_line = ""
-
-            for word in words:
-
-                # Try adding this word
-
-                test_line = current_line + word + " "
-
-                width, _ = self.font.size(test_line)
-
-                if width < self.rect.width:
-
-                    current_line = test_line
-
-                else:
-
-                    self.lines.append(current_line)
-
-                    current_line = word + " "
-
-            # Add the last line
-
-            if current_line:
-                self.lines.append(current_line)
-
-            # Add empty line between paragraphs
-
-            if len(paragraphs) > 1:
-                self.lines.append("")
+        self.lines = layout_text(self.text, self.font_size, self.rect.width)
 
     def set_text(self, text):
 
@@ -7050,21 +8342,20 @@ class UIText:
 
             self.wrap_text()
 
-    def draw(self, surface):
+            self.mark_dirty()
 
-        """Draw text on surface"""
+    def render(self, surface, rect):
 
-        if not self.visible:
-            return
+        """Draw text into rect of surface"""
 
         # Draw background if specified
 
         if self.bg_color:
-            pygame.draw.rect(surface, self.bg_color, self.rect)
+            pygame.draw.rect(surface, opaque(self.bg_color), rect)
 
         # Draw each line
 
-        y = self.rect.y
+        y = rect.y
 
         line_height = self.font.get_linesize()
 
@@ -7082,15 +8373,15 @@ class UIText:
 
             if self.align == "left":
 
-                x = self.rect.x
+                x = rect.x
 
             elif self.align == "center":
 
-                x = self.rect.x + (self.rect.width - text_surface.get_width()) // 2
+                x = rect.x + (rect.width - text_surface.get_width()) // 2
 
             else:  # right
 
-                x = self.rect.x + self.rect.width - text_surface.get_width()
+                x = rect.x + rect.width - text_surface.get_width()
 
             # Draw text
 
@@ -7100,7 +8391,7 @@ class UIText:
 
             # Stop if we go past the bottom of the rect
 
-            if y > self.rect.bottom:
+            if y > rect.bottom:
                 break
 
     def handle_event(self, event):
@@ -7112,7 +8403,7 @@ class UIText:
 
 # UI Progress Bar
 
-class UIProgressBar:
+class UIProgressBar(UIElement):
 
     def __init__(self, rect, value=100, max_value=100, color=COLORS["ui_health"],
 
@@ -7140,49 +8431,58 @@ class UIProgressBar:
 
         self.visible = True
 
+        self.dirty = True
+
+        self.cache = None
+
         # Create font for text
 
-        self.font = pygame.font.Font(None, 18)
+        self.font = get_font(18)
 
     def set_value(self, value):
 
         """Set current value"""
 
-        self.value = max(0, min(value, self.max_value))
+        value = max(0, min(value, self.max_value))
+
+        if value != self.value:
+            self.value = value
+
+            self.mark_dirty()
 
     def set_max_value(self, max_value):
 
         """Set maximum value"""
 
-        self.max_value = max_value
+        if max_value != self.max_value:
+            self.max_value = max_value
 
-        self.value = min(self.value, self.max_value)
+            self.value = min(self.value, self.max_value)
 
-    def draw(self, surface):
+            self.mark_dirty()
 
-        """Draw progress bar on surface"""
+    def render(self, surface, rect):
 
-        if not self.visible:
-            return
+        """Draw progress bar into rect of surface"""
 
         # Draw background
 
-        pygame.draw.rect(surface, self.bg_color, self.rect)
+        pygame.draw.rect(surface, opaque(self.bg_color), rect)
 
         # Calculate filled portion
 
-        fill_width = int(self.rect.width * (self.value / self.max_value))
+        fill_width = int(rect.width * (self.value / self.max_value))
 
-        fill_rect = pygame.Rect(self.rect.x, self.rect.y, fill_width, self.rect.height)
+        fill_rect = pygame.Rect(rect.x, rect.y, fill_width, rect.height)
 
         # Draw filled portion
 
-        pygame.draw.rect(surface, self.color, fill_rect)
+        pygame.draw.rect(surface, opaque(self.color), fill_rect)
 
         # Draw border
 
         if self.border_width > 0:
-            pygame.draw.rect(surface, self.border_color, self.rect, self.border_width)
+            pygame.draw.rect(surface, opaque(self.border_color), rect, self.border_width)
 
         # Draw text if enabled
 
@@ -7191,7 +8491,7 @@ class UIProgressBar:
 
             text_surface = self.font.render(text, True, self.text_color)
 
-            text_rect = text_surface.get_rect(center=self.rect.center)
+            text_rect = text_surface.get_rect(center=rect.center)
 
             surface.blit(text_surface, text_rect)
 
@@ -7204,7 +8504,7 @@ class UIProgressBar:
 
 # UI Image class
 
-class UIImage:
+class UIImage(UIElement):
 
     def __init__(self, rect, image, bg_color=None, border_color=None, border_width=0, scale=True):
 
@@ -7222,6 +8522,10 @@ class UIImage:
 
         self.visible = True
 
+        self.dirty = True
+
+        self.cache = None
+
         # Scale image if needed
 
         if self.scale and self.original_image:
@@ -7250,26 +8554,34 @@ class UIImage:
 
             self.image = self.original_image
 
+        self.mark_dirty()
+
     def draw(self, surface):
 
         """Draw image on surface"""
 
-        if not self.visible or not self.image:
+        if not self.image:
             return
 
+        super().draw(surface)
+
+    def render(self, surface, rect):
+
+        """Draw image into rect of surface"""
+
         # Draw background if specified
 
         if self.bg_color:
-            pygame.draw.rect(surface, self.bg_color, self.rect)
+            pygame.draw.rect(surface, opaque(self.bg_color), rect)
 
         # Draw image
 
-        surface.blit(self.image, self.rect)
+        surface.blit(self.image, rect)
 
         # Draw border if specified
 
         if self.border_color and self.border_width > 0:
-            pygame.draw.rect(surface, self.border_color, self.rect, self.border_width)
+            pygame.draw.rect(surface, opaque(self.border_color), rect, self.border_width)
 
     def handle_event(self, event):
 
@@ -7280,7 +8592,7 @@ class UIImage:
 
 # UI Inventory Slot class
 
-class UIInventorySlot:
+class UIInventorySlot(UIElement):
 
     def __init__(self, rect, item=None, callback=None, bg_color=(50, 50, 70),
 
@@ -7304,22 +8616,25 @@ class UIInventorySlot:
 
         self.hovered = False
 
+        self.dirty = True
+
+        self.cache = None
+
         # Create font for item count
 
-        self.font = pygame.font.Font(None, 16)
+        self.font = get_font(16)
 
     def set_item(self, item):
 
-        """Set slot item"""
+        """Set slot item (always redrawn, since the same item may have a new count)"""
 
         self.item = item
 
-    def draw(self, surface):
+        self.mark_dirty()
 
-        """Draw inventory slot on surface"""
+    def render(self, surface, rect):
 
-        if not self.visible:
-            return
+        """Draw inventory slot into rect of surface"""
 
         # Draw background - change color if selected or hovered
 
@@ -7335,16 +8650,16 @@ class UIInventorySlot:
 
             color = self.bg_color
 
-        pygame.draw.rect(surface, color, self.rect, border_radius=3)
+        pygame.draw.rect(surface, opaque(color), rect, border_radius=3)
 
-        pygame.draw.rect(surface, COLORS["ui_border"], self.rect, 1, border_radius=3)
+        pygame.draw.rect(surface, COLORS["ui_border"], rect, 1, border_radius=3)
 
         # Draw item if present
 
         if self.item:
-            self.draw_item(surface)
+            self.draw_item(surface, rect)
 
-    def draw_item(self, surface):
+    def draw_item(self, surface, rect):
 
         """Draw item in slot"""
 
@@ -7381,30 +8696,30 @@ class UIInventorySlot:
 
         # Draw item icon
 
-        icon_size = min(self.rect.width, self.rect.height) - 6
+        icon_size = min(rect.width, rect.height) - 6
 
         icon_rect = pygame.Rect(
 
-            self.rect.x + (self.rect.width - icon_size) // 2,
+            rect.x + (rect.width - icon_size) // 2,
 
-            self.rect.y + (self.rect.height - icon_size) // 2,
+            rect.y + (rect.height - icon_size) // 2,
 
             icon_size, icon_size
 
         )
 
-        pygame.draw.rect(surface, color, icon_rect, border_radius=2)
+        pygame.draw.rect(surface, opaque(color), icon_rect, border_radius=2)
 
         # Draw item count if stackable
 
         if hasattr(self.item, 'count') and self.item.count > 1:
             count_text = self.font.render(str(self.item.count), True, self.text_color)
 
-            text_rect = count_text.get_rect(bottomright=(self.rect.right - 2, self.rect.bottom - 2))
+            text_rect = count_text.get_rect(bottomright=(rect.right - 2, rect.bottom - 2))
 
             # Draw background for text
 
-            pygame.draw.rect(surface, (0, 0, 0, 150), text_rect.inflate(2, 2))
+            pygame.draw.rect(surface, (0, 0, 0), text_rect.inflate(2, 2))
 
             # Draw text
 
@@ -7421,7 +8736,12 @@ class UIInventorySlot:
 
             # Check hover state
 
-            self.hovered = self.rect.collidepoint(event.pos)
+            hovered = self.rect.collidepoint(event.pos)
+
+            if hovered != self.hovered:
+                self.hovered = hovered
+
+                self.mark_dirty()
 
 
 
@@ -7455,6 +8775,8 @@ class UIManager:
 
         self.modal_panel = None
 
+        self.overlay = None  # Darkening overlay behind modal panels, reused while the screen size is unchanged
+
     def add_element(self, element):
 
         """Add UI element to manager"""
@@ -7498,11 +8820,12 @@ class UIManager:
         if self.modal_panel:
             # Darken screen behind modal
 
-            overlay = pygame.Surface(self.screen.get_size(), pygame.SRCALPHA)
+            if self.overlay is None or self.overlay.get_size() != self.screen.get_size():
+                self.overlay = pygame.Surface(self.screen.get_size(), pygame.SRCALPHA)
 
-            overlay.fill((0, 0, 0, 150))  # Semi-transparent black
+                self.overlay.fill((0, 0, 0, 150))  # Semi-transparent black
 
-            self.screen.blit(overlay, (0, 0))
+            self.screen.blit(self.overlay, (0, 0))
 
             # Draw modal panel
 
@@ -7550,54 +8873,221 @@ class UIManager:
 
         # Add text to tooltip
 
-        tooltip.add_child(UIText(
+        tooltip.add_child(UIText(
+
+            pygame.Rect(5, 5, tooltip_width - 10, tooltip_height - 10),
+
+            text,
+
+            font_size=16,
+
+            color=COLORS["ui_text"]
+
+        ))
+
+        # Position tooltip to be fully visible
+
+        if tooltip.rect.right > self.screen.get_width():
+            tooltip.rect.right = self.screen.get_width() - 5
+
+        if tooltip.rect.bottom > self.screen.get_height():
+            tooltip.rect.bottom = self.screen.get_height() - 5
+
+        self.active_tooltip = tooltip
+
+    def hide_tooltip(self):
+
+        """Hide active tooltip"""
+
+        self.active_tooltip = None
+
+    def show_modal(self, panel):
+
+        """Show modal panel"""
+
+        self.modal_panel = panel
+
+    def hide_modal(self):
+
+        """Hide modal panel"""
+
+        self.modal_panel = None
+
+
+# Input sources
+
+class KeyboardInput:
+
+    """Input from the real keyboard and mouse through the pygame event queue"""
+
+    def get_events(self):
+
+        """Get the events of this frame"""
+
+        return pygame.event.get()
+
+    def get_pressed(self):
+
+        """Get the held key states, indexable by key constant"""
+
+        return pygame.key.get_pressed()
+
+
+class HeldKeys(set):
+
+    """Set of held keys that can be indexed like pygame.key.get_pressed()"""
+
+    def __getitem__(self, key):
+
+        return key in self
+
+
+class ScriptedInput:
+
+    """Injected input for headless runs
+
+    Keys are held with press() and let go with release(), and events queued with
+    post() are delivered on the next frame. An optional script(input, frame) is
+    called at the start of every frame to drive the input.
+    """
+
+    def __init__(self, script=None):
+
+        self.script = script
+
+        self.frame = 0
+
+        self.held = HeldKeys()
+
+        self.queue = []
+
+    def press(self, *keys):
+
+        """Hold keys down, posting their KEYDOWN events"""
+
+        for key in keys:
+
+            if key not in self.held:
+                self.held.add(key)
+
+                self.post(pygame.event.Event(pygame.KEYDOWN, key=key))
+
+    def release(self, *keys):
+
+        """Let go of held keys, posting their KEYUP events"""
+
+        for key in keys:
+
+            if key in self.held:
+                self.held.discard(key)
+
+                self.post(pygame.event.Event(pygame.KEYUP, key=key))
+
+    def post(self, event):
+
+        """Queue an event for the next frame"""
+
+        self.queue.append(event)
+
+    def get_events(self):
+
+        """Run the script for this frame and get the queued events"""
+
+        if self.script:
+            self.script(self, self.frame)
+
+        self.frame += 1
+
+        events, self.queue = self.queue, []
+
+        return events
+
+    def get_pressed(self):
+
+        """Get the held key states, indexable by key constant"""
+
+        return self.held
+
+
+def load_input_script(path):
+
+    """Read a headless input script into a script(input, frame) for ScriptedInput
+
+    Each line is "FRAME press|release KEY..." with pygame key names without the
+    K_ prefix (e.g. "0 press RIGHT SPACE", "40 release SPACE"); keys stay held
+    until released. Blank lines and lines starting with # are skipped.
+    """
+
+    actions = defaultdict(list)
+
+    with open(path, encoding="utf-8") as file:
+
+        for line_number, line in enumerate(file, 1):
+
+            parts = line.split()
+
+            if not parts or parts[0].startswith("#"):
+                continue
+
+            if len(parts) < 3 or not parts[0].isdigit() or parts[1] not in ("press", "release"):
+                raise ValueError(f"{path}:{line_number}: expected 'FRAME press|release KEY...'")
+
+            keys = []
 
-            pygame.Rect(5, 5, tooltip_width - 10, tooltip_height - 10),
+            for name in parts[2:]:
 
-            text,
+                key = getattr(pygame, "K_" + name, None)
 
-            font_size=16,
+                if key is None:
+                    key = getattr(pygame, "K_" + name.upper(), None)
 
-            color=COLORS["ui_text"]
+                if key is None:
+                    raise ValueError(f"{path}:{line_number}: unknown key {name!r}")
 
-        ))
+                keys.append(key)
 
-        # Position tooltip to be fully visible
+            actions[int(parts[0])].append((parts[1], keys))
 
-        if tooltip.rect.right > self.screen.get_width():
-            tooltip.rect.right = self.screen.get_width() - 5
+    def script(input_source, frame):
 
-        if tooltip.rect.bottom > self.screen.get_height():
-            tooltip.rect.bottom = self.screen.get_height() - 5
+        for action, keys in actions.get(frame, ()):
+            getattr(input_source, action)(*keys)
 
-        self.active_tooltip = tooltip
+    return script
 
-    def hide_tooltip(self):
 
-        """Hide active tooltip"""
+# Game class to manage game state
 
-        self.active_tooltip = None
+class Game:
 
-    def show_modal(self, panel):
+    def __init__(self, headless=False, input_source=None, timestep=None):
 
-        """Show modal panel"""
+        """Create the game
 
-        self.modal_panel = panel
+        A headless game runs on the SDL dummy video driver, is never drawn and
+        advances by a fixed timestep (HEADLESS_TIMESTEP unless given) instead of
+        the wall clock, as fast as the CPU allows. Input comes from input_source,
+        the keyboard by default.
 
-    def hide_modal(self):
+        With a fixed timestep nothing depends on the wall clock: chunks are
+        generated when requested and pathfinding runs a fixed number of searches
+        per frame, so the same random seed and input replay the same game.
+        """
 
-        """Hide modal panel"""
+        self.headless = headless
 
-        self.modal_panel = None
+        self.input = input_source or KeyboardInput()
 
+        self.timestep = timestep or (HEADLESS_TIMESTEP if headless else None)
 
-# Game class to manage game state
+        # Initialize pygame
 
-class Game:
+        if headless and os.environ.get("SDL_VIDEODRIVER") != "dummy":
+            # The display was already initialized at import with the real driver
 
-    def __init__(self):
+            os.environ["SDL_VIDEODRIVER"] = "dummy"
 
-        # Initialize pygame
+            pygame.display.quit()
 
         pygame.init()
 
@@ -7609,7 +9099,7 @@ class Game:
 
         # Create game map
 
-        self.map = GameMap()
+        self.map = GameMap(synchronous=self.timestep is not None)
 
         # 创建玩家（位于中心）
         self.player = Player(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2, self)
@@ -7636,21 +9126,47 @@ class Game:
 
         self.all_sprites = pygame.sprite.Group()
 
-        self.enemies = pygame.sprite.Group()
+        self.enemies = SpatialGroup()
 
-        self.npcs = pygame.sprite.Group()
+        self.npcs = SpatialGroup()
 
-        self.items = pygame.sprite.Group()
+        self.items = SpatialGroup()
 
         # Add player to sprites
 
         self.all_sprites.add(self.player)
 
+        # Monster activity tiers (see update_monsters)
+
+        self.active_monsters = {}
+
+        self.sim_time = 0
+
+        self.sim_frame = 0
+
+        self.monsters_spawned = 0  # Monsters created so far, numbers each in spawn order
+
+        self.drawn_entities = 0  # Entities on screen in the last drawn frame
+
+        self.flow_field = FlowField(self.map)  # Paths to the player for chasing monsters
+
+        path_searches = PATHFINDING_SEARCHES_PER_FRAME if self.timestep else None  # Per frame, when not timed
+
+        self.pathfinder = PathfindingService(self.map, max_searches=path_searches)  # Paths for patrolling monsters
+
+        self.movement_batch = MonsterMovementBatch(self.map) if BATCH_MONSTER_MOVEMENT else None
+
         # Generate initial map area
 
-        self.generated_chunks = set()
+        self.generated_chunks = set()  # Chunks whose entities have been generated
 
-        self.check_and_generate_chunks()
+        self.chunk_entities = {}  # Home chunk -> live entities homed there (monsters rehome as they move)
+
+        self.chunk_entity_records = OrderedDict()  # Home chunk -> plain-data records of despawned entities, oldest first
+
+        self.last_player_center = self.player.rect.center
+
+        self.check_and_generate_chunks(wait=True)
 
         # Game state
 
@@ -8689,9 +10205,7 @@ Currency: {self.player.gold} gold, {self.player.silver} silver, {self.player.cop
 
                 item_entity = Item(self.player.rect.centerx, self.player.rect.centery, dropped_item)
 
-                self.items.add(item_entity)
-
-                self.all_sprites.add(item_entity)
+                self.add_entity(item_entity, self.items)
 
             # Update UI
 
@@ -8809,38 +10323,240 @@ Currency: {self.player.gold} gold, {self.player.silver} silver, {self.player.cop
 
         self.exp_bar.set_max_value(self.player.stats["next_level_exp"])
 
-    def check_and_generate_chunks(self):
+    def check_and_generate_chunks(self, wait=False):
 
         """Check and generate map chunks around player"""
 
+        chunk_pixels = CHUNK_SIZE * TILE_SIZE
+
         # Get player's chunk coordinates
 
-        player_chunk_x = self.player.rect.centerx // (CHUNK_SIZE * TILE_SIZE)
+        player_chunk_x = self.player.rect.centerx // chunk_pixels
+
+        player_chunk_y = self.player.rect.centery // chunk_pixels
+
+        self.map.center_chunk = (player_chunk_x, player_chunk_y)
+
+        # Take over chunks finished in the background
+
+        self.map.integrate_ready_chunks()
+
+        # Load 3x3 grid of chunks around player (in the background unless waiting)
+
+        nearby_chunks = [(cx, cy)
+                         for cy in range(player_chunk_y - 1, player_chunk_y + 2)
+                         for cx in range(player_chunk_x - 1, player_chunk_x + 2)]
+
+        for cx, cy in nearby_chunks:
+
+            if wait:
+
+                self.map.ensure_chunk(cx, cy)
+
+            else:
+
+                self.map.request_chunk(cx, cy)
+
+        # Prefetch the chunks around where the player is heading
+
+        velocity_x = self.player.rect.centerx - self.last_player_center[0]
+
+        velocity_y = self.player.rect.centery - self.last_player_center[1]
+
+        self.last_player_center = self.player.rect.center
+
+        if velocity_x or velocity_y:
+
+            ahead_chunk_x = (self.player.rect.centerx + velocity_x * CHUNK_PREFETCH_FRAMES) // chunk_pixels
+
+            ahead_chunk_y = (self.player.rect.centery + velocity_y * CHUNK_PREFETCH_FRAMES) // chunk_pixels
+
+            if (ahead_chunk_x, ahead_chunk_y) != (player_chunk_x, player_chunk_y):
+
+                for cy in range(ahead_chunk_y - 1, ahead_chunk_y + 2):
+
+                    for cx in range(ahead_chunk_x - 1, ahead_chunk_x + 2):
+                        self.map.request_chunk(cx, cy)
+
+        # Populate nearby chunks once their terrain is ready
+
+        for chunk_key in nearby_chunks:
+
+            if chunk_key not in self.map.terrain_map:
+
+                continue
+
+            if chunk_key in self.chunk_entity_records:
+                # Bring back entities despawned when the player left
+
+                self.rehydrate_chunk_entities(chunk_key)
+
+            if chunk_key not in self.generated_chunks:
+                # Generate entities in this chunk
+
+                self.generate_entities_in_chunk(*chunk_key)
+
+                # Mark chunk as generated, and track it even if it got no entities
+
+                self.generated_chunks.add(chunk_key)
+
+                self.chunk_entities.setdefault(chunk_key, {})
+
+        # Despawn entities of chunks the player left far behind
+
+        for chunk_x, chunk_y in list(self.chunk_entities):
+
+            if abs(chunk_x - player_chunk_x) > ENTITY_KEEP_RADIUS or abs(chunk_y - player_chunk_y) > ENTITY_KEEP_RADIUS:
+                self.despawn_chunk_entities((chunk_x, chunk_y))
+
+        # Noise samples are only needed around the player
+
+        self.map.release_noise_outside(player_chunk_x, player_chunk_y)
+
+        # Move chunks the player left behind out of memory, with their entities
+
+        evicted = self.map.evict_chunks(player_chunk_x, player_chunk_y)
+
+        for chunk_key in evicted:
+            self.despawn_chunk_entities(chunk_key)
+
+        # Paths across evicted chunks go with them
+
+        if evicted:
+            self.pathfinder.drop_chunks(evicted)
+
+    def next_spawn_index(self):
+
+        """Number a new monster in spawn order, which is the same in every run"""
+
+        index = self.monsters_spawned
+
+        self.monsters_spawned += 1
+
+        return index
+
+    def get_chunk_key(self, x, y):
+
+        """Get the chunk containing a pixel position"""
+
+        return x // (CHUNK_SIZE * TILE_SIZE), y // (CHUNK_SIZE * TILE_SIZE)
+
+    def add_entity(self, entity, group, home_chunk=None):
+
+        """Add a monster, NPC or item to the world, owned by its home chunk (default: where it stands)"""
+
+        group.add(entity)
+
+        self.all_sprites.add(entity)
+
+        if home_chunk is None:
+            home_chunk = self.get_chunk_key(*entity.rect.center)
+
+        entity.home_chunk = home_chunk
+
+        self.chunk_entities.setdefault(home_chunk, {})[entity] = None
+
+    def update_home_chunk(self, entity):
+
+        """Move a live entity to the chunk it stands in now, so it despawns with that chunk"""
+
+        chunk_key = self.get_chunk_key(*entity.rect.center)
+
+        if chunk_key == entity.home_chunk or not entity.alive():
+            return
+
+        entities = self.chunk_entities.get(entity.home_chunk)
+
+        # An emptied chunk keeps its entry, so it still despawns to (empty) records
+
+        if entities is not None:
+            entities.pop(entity, None)
+
+        entity.home_chunk = chunk_key
+
+        self.chunk_entities.setdefault(chunk_key, {})[entity] = None
+
+    def despawn_chunk_entities(self, chunk_key):
+
+        """Turn the live entities of a chunk into plain-data records and drop them from the world"""
+
+        entities = self.chunk_entities.pop(chunk_key, None)
+
+        if entities is None:
+            return
+
+        records = self.chunk_entity_records.setdefault(chunk_key, [])
+
+        self.chunk_entity_records.move_to_end(chunk_key)
+
+        for entity in entities:
+
+            # Killed monsters and picked up items are already gone
+
+            if not entity.alive():
+                continue
+
+            x, y = entity.rect.center
+
+            if isinstance(entity, Monster):
+
+                records.append(("monster", entity.monster_type.value, entity.level, x, y, entity.stats["hp"]))
+
+            elif isinstance(entity, NPC):
 
-        player_chunk_y = self.player.rect.centery // (CHUNK_SIZE * TILE_SIZE)
+                records.append(("npc", entity.biome.value, x, y, tuple(item.to_record() for item in entity.items)))
 
-        # Generate 3x3 grid of chunks around player
+            elif isinstance(entity, Item):
 
-        for cy in range(player_chunk_y - 1, player_chunk_y + 2):
+                records.append(("item", entity.equipment.to_record(), x, y))
 
-            for cx in range(player_chunk_x - 1, player_chunk_x + 2):
+            entity.kill()
 
-                chunk_key = (cx, cy)
+        # Forget the oldest records; those chunks are repopulated afresh when revisited
 
-                # Only generate if not already generated
+        while len(self.chunk_entity_records) > MAX_ENTITY_RECORD_CHUNKS:
 
-                if chunk_key not in self.generated_chunks:
-                    # Generate map chunk
+            forgotten, _ = self.chunk_entity_records.popitem(last=False)
 
-                    self.map.generate_chunk(cx, cy)
+            self.generated_chunks.discard(forgotten)
 
-                    # Generate entities in this chunk
+    def rehydrate_chunk_entities(self, chunk_key):
 
-                    self.generate_entities_in_chunk(cx, cy)
+        """Recreate the entities of a chunk from their records"""
 
-                    # Mark chunk as generated
+        self.chunk_entities.setdefault(chunk_key, {})
 
-                    self.generated_chunks.add(chunk_key)
+        for record in self.chunk_entity_records.pop(chunk_key, []):
+
+            kind = record[0]
+
+            if kind == "monster":
+
+                _, monster_type, level, x, y, hp = record
+
+                entity = Monster(x, y, MonsterType(monster_type), level, self)
+
+                entity.stats["hp"] = hp
+
+                group = self.enemies
+
+            elif kind == "npc":
+
+                _, biome, x, y, items = record
+
+                entity = NPC(x, y, Biome(biome), [Equipment.from_record(item) for item in items])
+
+                group = self.npcs
+
+            else:
+
+                _, equipment, x, y = record
+
+                entity = Item(x, y, Equipment.from_record(equipment))
+
+                group = self.items
+
+            self.add_entity(entity, group, chunk_key)
 
     def generate_entities_in_chunk(self, chunk_x, chunk_y):
 
@@ -8912,9 +10628,8 @@ Currency: {self.player.gold} gold, {self.player.silver} silver, {self.player.cop
                     # 创建怪物（传递game引用）
                     monster = Monster(x, y, monster_type, level, self)
 
-                    # 添加到精灵组
-                    self.enemies.add(monster)
-                    self.all_sprites.add(monster)
+                    # 添加到精灵组，归属于该区块
+                    self.add_entity(monster, self.enemies, self.get_chunk_key(*chunk_rect.topleft))
 
                     break  # 成功生成
 
@@ -8922,17 +10637,11 @@ Currency: {self.player.gold} gold, {self.player.silver} silver, {self.player.cop
 
         """Determine monster type based on biome"""
 
-        # Use weights from biome configuration
+        # Use the precomputed sampler for the biome
 
-        if biome in BIOME_MONSTER_WEIGHTS:
+        if biome in MONSTER_SAMPLERS:
 
-            weights = BIOME_MONSTER_WEIGHTS[biome]
-
-            # Choose monster type based on weights
-
-            monster_types, monster_weights = zip(*weights)
-
-            return random.choices(monster_types, weights=monster_weights, k=1)[0]
+            return MONSTER_SAMPLERS[biome].choose()
 
         else:
 
@@ -8965,11 +10674,9 @@ Currency: {self.player.gold} gold, {self.player.silver} silver, {self.player.cop
 
                 npc = NPC(x, y, biome)
 
-                # Add to sprite groups
-
-                self.npcs.add(npc)
+                # Add to sprite groups, owned by this chunk
 
-                self.all_sprites.add(npc)
+                self.add_entity(npc, self.npcs, self.get_chunk_key(*chunk_rect.topleft))
 
                 break  # Successfully spawned
 
@@ -9010,11 +10717,9 @@ Currency: {self.player.gold} gold, {self.player.silver} silver, {self.player.cop
 
                     item_entity = Item(x, y, item)
 
-                    # Add to sprite groups
-
-                    self.items.add(item_entity)
+                    # Add to sprite groups, owned by this chunk
 
-                    self.all_sprites.add(item_entity)
+                    self.add_entity(item_entity, self.items, self.get_chunk_key(*chunk_rect.topleft))
 
                     break  # Successfully spawned
 
@@ -9103,8 +10808,7 @@ Currency: {self.player.gold} gold, {self.player.silver} silver, {self.player.cop
                 monster = Monster(x, y, monster_type, 1, self)
 
                 # 添加到精灵组
-                self.enemies.add(monster)
-                self.all_sprites.add(monster)
+                self.add_entity(monster, self.enemies)
 
     def spawn_npcs(self, count):
 
@@ -9139,13 +10843,13 @@ Currency: {self.player.gold} gold, {self.player.silver} silver, {self.player.cop
 
                 # Add to sprite groups
 
-                self.npcs.add(npc)
-
-                self.all_sprites.add(npc)
+                self.add_entity(npc, self.npcs)
 
     def check_player_item_pickups(self):
         """检查玩家是否可以拾取附近的物品"""
-        for item in self.items:
+        nearby_items = self.items.get_in_radius(self.player.rect.centerx, self.player.rect.centery,
+                                                ITEM_PICKUP_RADIUS)
+        for item in nearby_items:
             # 计算与玩家的距离
             distance = ((item.rect.centerx - self.player.rect.centerx) ** 2 +
                         (item.rect.centery - self.player.rect.centery) ** 2) ** 0.5
@@ -9172,12 +10876,15 @@ Currency: {self.player.gold} gold, {self.player.silver} silver, {self.player.cop
 
         # Only check if E key is pressed
 
-        keys = pygame.key.get_pressed()
+        keys = self.input.get_pressed()
 
         if not keys[pygame.K_e]:
             return
 
-        for npc in self.npcs:
+        nearby_npcs = self.npcs.get_in_radius(self.player.rect.centerx, self.player.rect.centery,
+                                              NPC_INTERACTION_RADIUS)
+
+        for npc in nearby_npcs:
 
             # Check if in range
 
@@ -9195,7 +10902,10 @@ Currency: {self.player.gold} gold, {self.player.silver} silver, {self.player.cop
     def update(self):
         """更新游戏状态"""
         # 计算 delta time
-        self.dt = self.clock.tick(60) / 1000.0
+        if self.timestep:
+            self.dt = self.timestep
+        else:
+            self.dt = self.clock.tick(60) / 1000.0
 
         # 如果游戏结束则跳过更新
         if self.game_over:
@@ -9226,14 +10936,21 @@ Currency: {self.player.gold} gold, {self.player.silver} silver, {self.player.cop
 
         self.check_and_generate_chunks()
 
+        # Chasing monsters head for the player's tile
+
+        self.flow_field.set_target(self.player.rect.centerx // TILE_SIZE, self.player.rect.centery // TILE_SIZE)
+
+        # Run queued path searches within their time budget
+
+        self.pathfinder.process()
+
         # Update camera
 
         self.camera.update(self.player)
 
         # Update enemies
 
-        for enemy in self.enemies:
-            enemy.update(self.dt, self.player, self.map)
+        self.update_monsters()
 
         # Update NPCs
 
@@ -9257,11 +10974,107 @@ Currency: {self.player.gold} gold, {self.player.silver} silver, {self.player.cop
 
         self.update_status_bars()
 
+    def update_monsters(self):
+
+        """Update monsters by activity tier around the camera"""
+
+        self.sim_time += self.dt
+
+        self.sim_frame += 1
+
+        # Full updates for monsters on or near the screen
+
+        full_rect = pygame.Rect(-self.camera.rect.x, -self.camera.rect.y,
+                                self.camera.width, self.camera.height).inflate(2 * SIM_FULL_MARGIN,
+                                                                               2 * SIM_FULL_MARGIN)
+
+        # Coarse ticks in the ring around that, everything farther is dormant
+
+        player_x, player_y = self.player.rect.center
+
+        coarse_rect = pygame.Rect(player_x - SIM_COARSE_RADIUS, player_y - SIM_COARSE_RADIUS,
+                                  2 * SIM_COARSE_RADIUS, 2 * SIM_COARSE_RADIUS).union(full_rect)
+
+        active = dict.fromkeys(self.enemies.query_rect(coarse_rect))  # Ordered, unlike a set
+
+        # Monsters that left the active area go dormant
+
+        for enemy in self.active_monsters:
+
+            if enemy not in active and enemy.alive():
+                # Simulated up to the end of last frame, minus any coarse time not yet applied
+
+                enemy.dormant_since = self.sim_time - self.dt - enemy.pending_dt
+
+                enemy.pending_dt = 0
+
+                enemy.pending_frames = 0
+
+        self.active_monsters = active
+
+        # Collect the moves of this frame to step them together
+
+        if self.movement_batch is not None:
+            self.movement_batch.begin()
+
+        redraw = []
+
+        for enemy in active:
+
+            # Waking up: catch up on the time spent dormant
+
+            if enemy.dormant_since is not None:
+
+                enemy.fast_forward(self.sim_time - self.dt - enemy.dormant_since)
+
+                enemy.dormant_since = None
+
+                if not enemy.alive():
+                    continue
+
+            if full_rect.collidepoint(enemy.rect.center):
+
+                enemy.simulate(self.dt + enemy.pending_dt, self.player, self.map, 1 + enemy.pending_frames)
+
+                enemy.pending_dt = 0
+
+                enemy.pending_frames = 0
+
+                redraw.append(enemy)
+
+            else:
+
+                # Coarse tick: spread over frames by spawn order, no appearance work
+
+                enemy.pending_dt += self.dt
+
+                enemy.pending_frames += 1
+
+                if (self.sim_frame + enemy.spawn_index) % SIM_COARSE_INTERVAL == 0:
+                    enemy.simulate(enemy.pending_dt, self.player, self.map, enemy.pending_frames)
+
+                    enemy.pending_dt = 0
+
+                    enemy.pending_frames = 0
+
+        if self.movement_batch is not None:
+            self.movement_batch.step()
+
+        # Full updates end with the appearance, now that monsters have moved and turned
+
+        for enemy in redraw:
+            enemy.update_appearance()
+
+        for enemy in active:
+            self.enemies.reindex(enemy)
+
+            self.update_home_chunk(enemy)
+
     def handle_events(self):
 
         """Handle input events"""
 
-        for event in pygame.event.get():
+        for event in self.input.get_events():
 
             # Quit event
 
@@ -9378,12 +11191,7 @@ Currency: {self.player.gold} gold, {self.player.silver} silver, {self.player.cop
         base_gold = monster.level * 2
 
         # 基于怪物类型的奖励金币
-        if monster.monster_type == MonsterType.DRAGON:
-            base_gold *= 5
-        elif monster.monster_type == MonsterType.TROLL:
-            base_gold *= 3
-        elif monster.monster_type == MonsterType.BANDIT:
-            base_gold *= 2
+        base_gold *= monster.archetype.gold_multiplier
 
         # 添加随机性
         gold_amount = max(1, int(base_gold * random.uniform(0.8, 1.2)))
@@ -9403,8 +11211,7 @@ Currency: {self.player.gold} gold, {self.player.silver} silver, {self.player.cop
         item_entity = Item(monster.rect.centerx + offset_x, monster.rect.centery + offset_y, gold_item)
 
         # 添加到精灵组
-        self.items.add(item_entity)
-        self.all_sprites.add(item_entity)
+        self.add_entity(item_entity, self.items)
 
         # 更新统计数据
         self.update_player_statistics("total_gold", gold_amount)
@@ -9415,10 +11222,7 @@ Currency: {self.player.gold} gold, {self.player.silver} silver, {self.player.cop
         rarity_roll = random.random() + (monster.level * 0.02)
 
         # 特定怪物类型增加稀有度
-        if monster.monster_type == MonsterType.DRAGON:
-            rarity_roll += 0.2
-        elif monster.monster_type == MonsterType.BANDIT:
-            rarity_roll += 0.1
+        rarity_roll += monster.archetype.rarity_bonus
 
         if rarity_roll > 0.98:
             quality = "epic"
@@ -9451,8 +11255,7 @@ Currency: {self.player.gold} gold, {self.player.silver} silver, {self.player.cop
         item_entity = Item(monster.rect.centerx + offset_x, monster.rect.centery + offset_y, item)
 
         # 添加到精灵组
-        self.items.add(item_entity)
-        self.all_sprites.add(item_entity)
+        self.add_entity(item_entity, self.items)
 
         # 更新统计数据
         self.update_player_statistics("items_found")
@@ -9473,7 +11276,7 @@ Currency: {self.player.gold} gold, {self.player.silver} silver, {self.player.cop
 
         # Get keyboard state
 
-        keys = pygame.key.get_pressed()
+        keys = self.input.get_pressed()
 
         # Calculate movement direction
 
@@ -9511,18 +11314,24 @@ Currency: {self.player.gold} gold, {self.player.silver} silver, {self.player.cop
 
         self.map.draw(self.screen, self.camera)
 
-        # Draw sprites
+        # Draw sprites near the camera, dropped items below characters and lower sprites in front
 
-        for sprite in self.all_sprites:
+        render_list = self.get_render_list()
 
-            if isinstance(sprite, (Player, Monster, NPC, Item)):
+        for sprite in render_list:
+            sprite.draw(self.screen, camera_pos)
 
-                sprite.draw(self.screen, camera_pos)
+        self.drawn_entities = len(render_list)
 
-                # Draw floating texts for entities
+        # Draw floating texts over all sprites
 
-                if hasattr(sprite, "draw_floating_texts"):
-                    sprite.draw_floating_texts(self.screen, camera_pos)
+        view_rect = pygame.Rect(camera_pos, (self.camera.width, self.camera.height)).inflate(2 * DRAW_MARGIN,
+                                                                                             2 * DRAW_MARGIN)
+
+        for sprite in self.get_render_candidates(view_rect):
+
+            if getattr(sprite, "floating_texts", None):
+                sprite.draw_floating_texts(self.screen, camera_pos)
 
         # Draw UI
 
@@ -9531,9 +11340,7 @@ Currency: {self.player.gold} gold, {self.player.silver} silver, {self.player.cop
         # Draw paused text if paused
 
         if self.paused:
-            font = pygame.font.Font(None, 48)
-
-            text = font.render("PAUSED", True, (255, 255, 255))
+            text = render_text("PAUSED", (255, 255, 255), 48)
 
             text_rect = text.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2))
 
@@ -9543,32 +11350,134 @@ Currency: {self.player.gold} gold, {self.player.silver} silver, {self.player.cop
 
         pygame.display.flip()
 
+    def get_render_candidates(self, rect):
+
+        """Get the player and the monsters, NPCs and items filed near a world rect"""
+
+        # Sprites are filed by center, so look one margin further for sprites overlapping the rect
+
+        search_rect = rect.inflate(2 * DRAW_MARGIN, 2 * DRAW_MARGIN)
+
+        return ([self.player] + self.enemies.query_rect(search_rect) + self.npcs.query_rect(search_rect)
+                + self.items.query_rect(search_rect))
+
+    def get_render_list(self):
+
+        """Get the sprites overlapping the camera view, in drawing order
+
+        Dropped items are the bottom layer. Characters are above them, sorted by the
+        bottom of their sprite so that lower ones overlap the ones behind them.
+        """
+
+        view_rect = pygame.Rect(-self.camera.rect.x, -self.camera.rect.y, self.camera.width, self.camera.height)
+
+        visible = [sprite for sprite in self.get_render_candidates(view_rect)
+                   if sprite.rect.colliderect(view_rect)]
+
+        visible.sort(key=lambda sprite: (not isinstance(sprite, Item), sprite.rect.bottom))
+
+        return visible
+
     def restart_game(self):
 
         """Restart the game"""
 
-        self.__init__()  # Reinitialize game
+        self.map.shutdown()
+
+        self.__init__(self.headless, self.input, self.timestep)  # Reinitialize game
+
+    def step(self):
+
+        """Run one frame: input, update and, unless headless, drawing"""
+
+        self.handle_events()
+
+        self.handle_movement()
+
+        self.update()
+
+        if not self.headless:
+            self.draw()
 
     def run(self):
 
         """Main game loop"""
 
         while self.running:
-            self.handle_events()
+            self.step()
 
-            self.handle_movement()
+        self.map.shutdown()
 
-            self.update()
+        pygame.quit()
 
-            self.draw()
+    def simulate(self, frames):
 
-        pygame.quit()
+        """Run up to frames frames without the main loop, for soak tests
+
+        Stops early if the game quits. Returns the number of frames run.
+        """
+
+        for frame in range(frames):
+
+            if not self.running:
+                return frame
+
+            self.step()
+
+        return frames
 
 
 # Main function
 
 def main():
-    """Main function"""
+    """Main function
+
+    With --headless FRAMES the world is simulated for that many frames without a
+    window or drawing, and the simulation speed is printed. There is no keyboard
+    then, so the player only moves as told by an input script given with --script
+    (see load_input_script); without one it stands still and only the monster AI runs.
+    """
+
+    parser = argparse.ArgumentParser(description="Mystical Realms RPG")
+
+    parser.add_argument("--headless", type=int, metavar="FRAMES",
+                        help="simulate FRAMES frames without rendering and exit")
+
+    parser.add_argument("--script", metavar="FILE",
+                        help="drive the player in a headless run with the key presses in FILE")
+
+    parser.add_argument("--seed", type=int, help="seed the random world")
+
+    args = parser.parse_args()
+
+    if args.script is not None and args.headless is None:
+        parser.error("--script needs --headless")
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    if args.headless is not None:
+        try:
+            script = load_input_script(args.script) if args.script is not None else None
+        except (OSError, ValueError) as error:
+            parser.error(str(error))
+
+        game = Game(headless=True, input_source=ScriptedInput(script))
+
+        start = time.perf_counter()
+
+        frames = game.simulate(args.headless)
+
+        elapsed = time.perf_counter() - start
+
+        print(f"Simulated {frames} frames in {elapsed:.2f}s ({frames / max(elapsed, 1e-9):.0f} frames/s), "
+              f"{len(game.enemies)} monsters, {len(game.map.generated_chunks)} chunks loaded")
+
+        game.map.shutdown()
+
+        pygame.quit()
+
+        return
 
     # Initialize pygame
 
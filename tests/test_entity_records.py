@@ -0,0 +1,60 @@
+import os
+import pickle
+import random
+import sys
+import unittest
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame  # noqa: E402
+
+import RPGformal  # noqa: E402
+
+
+def walk_east(input_source, frame):
+    input_source.press(pygame.K_RIGHT)
+
+
+class EntityRecordTest(unittest.TestCase):
+
+    def setUp(self):
+        self.max_record_chunks = RPGformal.MAX_ENTITY_RECORD_CHUNKS
+        RPGformal.MAX_ENTITY_RECORD_CHUNKS = 8
+        random.seed(5)
+        self.game = RPGformal.Game(headless=True, input_source=RPGformal.ScriptedInput(walk_east))
+        self.game.map.is_passable = lambda x, y: True
+
+    def tearDown(self):
+        self.game.map.shutdown()
+        RPGformal.MAX_ENTITY_RECORD_CHUNKS = self.max_record_chunks
+
+    def test_records_stay_bounded_on_a_long_walk(self):
+        for _ in range(20):
+            self.game.simulate(200)
+            self.assertLessEqual(len(self.game.chunk_entity_records), 8)
+            self.assertLessEqual(len(self.game.generated_chunks),
+                                 len(self.game.chunk_entity_records) + len(self.game.chunk_entities))
+
+        # Records are plain data, and survive a rehydrate/despawn round trip unchanged
+        pickle.dumps(self.game.chunk_entity_records)
+        chunk_key = next(key for key, records in self.game.chunk_entity_records.items() if records)
+        records = list(self.game.chunk_entity_records[chunk_key])
+        self.game.rehydrate_chunk_entities(chunk_key)
+        self.game.despawn_chunk_entities(chunk_key)
+        self.assertEqual(self.game.chunk_entity_records[chunk_key], records)
+
+    def test_equipment_record_round_trip(self):
+        equipment = list(RPGformal.WEAPONS.values()) + list(RPGformal.ARMORS.values())
+        for tiers in RPGformal.UPGRADED_WEAPONS.values():
+            equipment += list(tiers.values())
+        for item in equipment:
+            copy = RPGformal.Equipment.from_record(item.to_record())
+            self.assertEqual(copy.to_record(), item.to_record())
+            self.assertEqual(copy.get_stats_text(), item.get_stats_text())
+
+
+if __name__ == "__main__":
+    unittest.main()
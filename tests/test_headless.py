@@ -0,0 +1,77 @@
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame  # noqa: E402
+
+import RPGformal  # noqa: E402
+
+
+def walk_and_attack(input_source, frame):
+    """Walk in a square, attacking every 40 frames"""
+    keys = [pygame.K_RIGHT, pygame.K_DOWN, pygame.K_LEFT, pygame.K_UP]
+    key = keys[(frame // 150) % len(keys)]
+    input_source.release(*[other for other in keys if other != key])
+    input_source.press(key)
+    if frame % 40 == 0:
+        input_source.press(pygame.K_SPACE)
+    else:
+        input_source.release(pygame.K_SPACE)
+
+
+def run_game(seed, frames):
+    """Simulate a seeded headless game and return a snapshot of its state"""
+    random.seed(seed)
+    game = RPGformal.Game(headless=True, input_source=RPGformal.ScriptedInput(walk_and_attack))
+    try:
+        game.simulate(frames)
+        return {
+            "player": (game.player.rect.topleft, sorted(game.player.stats.items())),
+            "monsters": [(monster.monster_type, monster.level, monster.rect.topleft, monster.stats["hp"])
+                         for monster in game.enemies],
+            "npcs": [npc.rect.topleft for npc in game.npcs],
+            "items": [item.rect.topleft for item in game.items],
+            "chunks": sorted(game.map.terrain_map),
+            "random": random.getstate(),
+        }
+    finally:
+        game.map.shutdown()
+
+
+class HeadlessReplayTest(unittest.TestCase):
+
+    def test_same_seed_replays_the_same_game(self):
+        first = run_game(7, 1500)
+        second = run_game(7, 1500)
+
+        self.assertTrue(first["monsters"])
+        for key in first:
+            self.assertEqual(first[key], second[key], key)
+
+    def test_input_script_moves_the_player(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as file:
+            file.write("# walk right, then stop\n0 press RIGHT\n100 release RIGHT\n")
+        self.addCleanup(os.remove, file.name)
+
+        random.seed(7)
+        input_source = RPGformal.ScriptedInput(RPGformal.load_input_script(file.name))
+        game = RPGformal.Game(headless=True, input_source=input_source)
+        try:
+            game.map.is_passable = lambda x, y: True
+            start_x = game.player.rect.x
+            game.simulate(200)
+            self.assertGreater(game.player.rect.x, start_x)
+            self.assertFalse(input_source.held)
+        finally:
+            game.map.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import random
+import sys
+import unittest
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import RPGformal  # noqa: E402
+
+
+class Walker(RPGformal.Monster):
+    """Monster whose AI only walks east"""
+
+    def update_ai(self, player, game_map):
+        self.move_toward((self.rect.centerx + 1000, self.rect.centery), game_map)
+
+
+class MonsterTierTest(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(3)
+        self.game = RPGformal.Game(headless=True)
+        self.game.map.is_passable = lambda x, y: True
+        self.game.dt = self.game.timestep
+        for enemy in list(self.game.enemies):
+            enemy.kill()
+
+    def tearDown(self):
+        self.game.map.shutdown()
+
+    def add_walker(self, x, y):
+        walker = Walker(x, y, RPGformal.MonsterType.WOLF, 1, self.game)
+        self.game.add_entity(walker, self.game.enemies)
+        return walker
+
+    def test_coarse_tier_walks_as_far_as_full_tier(self):
+        player_x, player_y = self.game.player.rect.center
+        full = self.add_walker(player_x, player_y + 150)
+        coarse = self.add_walker(player_x + RPGformal.SCREEN_WIDTH // 2 + RPGformal.SIM_FULL_MARGIN + 64, player_y)
+        full_start, coarse_start = full.rect.x, coarse.rect.x
+
+        coarse_ticks = 0
+        for _ in range(60):
+            self.game.update_monsters()
+            coarse_ticks += coarse.pending_dt == 0
+        self.assertIn(coarse, self.game.active_monsters)
+        self.assertLessEqual(coarse_ticks, 60 // RPGformal.SIM_COARSE_INTERVAL + 1)
+
+        step = RPGformal.PLAYER_SPEED * 0.8 * coarse.move_speed
+        self.assertGreater(full.rect.x - full_start, 50 * step)
+        self.assertAlmostEqual(coarse.rect.x - coarse_start, full.rect.x - full_start,
+                               delta=RPGformal.SIM_COARSE_INTERVAL * step)
+
+
+if __name__ == "__main__":
+    unittest.main()
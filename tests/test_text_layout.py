@@ -0,0 +1,81 @@
+import os
+import random
+import string
+import sys
+import unittest
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import RPGformal  # noqa: E402
+
+
+def game_texts():
+    """Item and skill descriptions as the UI shows them"""
+    equipment = list(RPGformal.WEAPONS.values()) + list(RPGformal.ARMORS.values())
+    equipment += list(RPGformal.POTIONS.values())
+    for tiers in list(RPGformal.UPGRADED_WEAPONS.values()) + list(RPGformal.UPGRADED_ARMORS.values()):
+        equipment += list(tiers.values())
+
+    texts = []
+    for item in equipment:
+        texts += [item.description, item.get_stats_text()]
+    for skill in RPGformal.SKILLS.values():
+        texts += [skill.description, skill.get_info()]
+    return texts
+
+
+def random_texts(count=200, seed=1):
+    """ASCII paragraphs of random words"""
+    rng = random.Random(seed)
+    alphabet = string.ascii_letters + string.digits + ".,:;!?'-()%+"
+    return [" ".join("".join(rng.choice(alphabet) for _ in range(rng.randint(1, 12)))
+                     for _ in range(rng.randint(5, 60)))
+            for _ in range(count)]
+
+
+def wrap_by_measuring(text, font, width):
+    """Reference wrapper, measuring every candidate line whole"""
+    lines = []
+    paragraphs = text.split('\n')
+    for paragraph in paragraphs:
+        current_line = ""
+        for word in paragraph.split(' '):
+            test_line = current_line + word + " "
+            if font.size(test_line)[0] < width or not current_line:
+                current_line = test_line
+            else:
+                lines.append(current_line)
+                current_line = word + " "
+        if current_line:
+            lines.append(current_line)
+        if len(paragraphs) > 1:
+            lines.append("")
+    return tuple(lines)
+
+
+class LayoutTextTest(unittest.TestCase):
+
+    def check_lines(self, texts, font_size, width):
+        font = RPGformal.get_font(font_size)
+        for text in texts:
+            lines = RPGformal.layout_text(text, font_size, width)
+            for line in lines:
+                if " " in line.strip():
+                    self.assertLess(font.size(line)[0], width, (text, line))
+            self.assertEqual(lines, wrap_by_measuring(text, font, width), text)
+
+    def test_game_texts_fit_the_ui(self):
+        for width in (460, 310):
+            self.check_lines(game_texts(), 16, width)
+
+    def test_random_texts_fit(self):
+        for font_size in (16, 18, 24):
+            for width in (330, 260, 150):
+                self.check_lines(random_texts(), font_size, width)
+
+
+if __name__ == "__main__":
+    unittest.main()
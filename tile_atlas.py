@@ -0,0 +1,42 @@
+import pygame
+
+
+# Tile atlas shared by the map renderers
+class TileAtlas:
+    """Terrain tiles pre-rendered once, indexed by terrain code (the enum value).
+
+    Plain tiles are only a color and are drawn with a fill. Decorated tiles are
+    painted once into their own Surface, with `overhang` transparent pixels on
+    top for decorations that reach into the tile above, and are blitted.
+    """
+
+    def __init__(self, tile_size, terrain_colors, painter=None, decorated=(), overhang=0):
+        self.tile_size = tile_size
+        self.overhang = overhang
+
+        size = max(terrain.value for terrain in terrain_colors) + 1
+        self.colors = [None] * size  # Base color per terrain code
+        self.surfaces = [None] * size  # Pre-rendered surface per decorated terrain code
+
+        for terrain, color in terrain_colors.items():
+            self.colors[terrain.value] = color
+            if terrain in decorated:
+                tile = pygame.Surface((tile_size, tile_size + overhang), pygame.SRCALPHA)
+                painter(tile, terrain, 0, overhang)
+                self.surfaces[terrain.value] = tile
+
+    def get_color(self, code):
+        """Get the base color of a terrain code"""
+        return self.colors[code]
+
+    def is_decorated(self, code):
+        """Check if a terrain code has decorations beyond its base color"""
+        return self.surfaces[code] is not None
+
+    def draw(self, surface, code, x, y):
+        """Draw the tile of a terrain code with its top-left corner at (x, y)"""
+        tile = self.surfaces[code]
+        if tile is None:
+            surface.fill(self.colors[code], (x, y, self.tile_size, self.tile_size))
+        else:
+            surface.blit(tile, (x, y - self.overhang))